@@ -0,0 +1,61 @@
+import asyncio, bisect, argparse
+from aiohttp import web
+from bench.synthetic import make_events, DEPT_COUNT
+
+class FakeApi:
+    # Pengganti API ZKTeco untuk benchmark: transaksi berhalaman, departemen, dan tambah orang
+    def __init__(self, events, latency_ms=0):
+        self.events = events
+        self.times = [e["eventTime"] for e in events]
+        self.visible = len(events)  # hanya event [:visible] yang "sudah terjadi"
+        self.latency = latency_ms / 1000
+        self.requests = {"transaction": 0, "dept": 0, "person_add": 0}
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/api/transaction/list", self.transactions)
+        app.router.add_get("/api/department/get/{dept_id}", self.department)
+        app.router.add_post("/api/person/add", self.person_add)
+        return app
+
+    async def transactions(self, request):
+        self.requests["transaction"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        page = int(request.query.get("pageNo", "1"))
+        size = int(request.query.get("pageSize", "100"))
+        first = bisect.bisect_left(self.times, request.query.get("startDate", ""), 0, self.visible)
+        total = self.visible - first
+        start = first + (page - 1) * size
+        data = self.events[start:min(start + size, self.visible)] if start < self.visible else []
+        return web.json_response({"code": 0, "message": "success", "total": total, "data": data})
+
+    async def department(self, request):
+        self.requests["dept"] += 1
+        dept_id = int(request.match_info["dept_id"])
+        if dept_id >= DEPT_COUNT:
+            return web.json_response({"code": -1, "message": "not found"})
+        return web.json_response({"code": 0, "data": {"id": dept_id, "code": str(dept_id), "name": f"Dept {dept_id}"}})
+
+    async def person_add(self, request):
+        self.requests["person_add"] += 1
+        await request.read()
+        return web.json_response({"code": 0, "message": "success"})
+
+async def start(api, host, port):
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+if __name__ == "__main__":
+    # python -m bench.fake_api --people 2000 --events 50000 --port 8780
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--people", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8780)
+    args = parser.parse_args()
+    api = FakeApi(make_events(args.people, args.events), args.latency_ms)
+    web.run_app(api.app(), host=args.host, port=args.port)
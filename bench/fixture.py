@@ -0,0 +1,76 @@
+import psycopg2
+from bench.synthetic import person_dept
+
+# Tabel BioSecurity minimal yang dipakai enrichment (api_tracker) dan blacklist
+FIXTURE_TABLES = ("pers_person", "pers_attribute_ext", "park_person", "park_car_number", "acc_person", "att_person")
+
+SCHEMA_SQL = """
+    CREATE TABLE pers_person (id serial PRIMARY KEY, pin varchar, name varchar, gender varchar,
+                              email varchar, mobile_phone varchar, birthday date);
+    CREATE TABLE pers_attribute_ext (id serial PRIMARY KEY, person_id int, {nipeg} varchar);
+    CREATE TABLE park_person (id serial PRIMARY KEY, pers_person_pin varchar);
+    CREATE TABLE park_car_number (id serial PRIMARY KEY, car_number varchar);
+    CREATE TABLE acc_person (id serial PRIMARY KEY, person_id int, disabled boolean);
+    CREATE TABLE att_person (id serial PRIMARY KEY, pers_person_pin varchar, pers_person_name varchar, dept_name varchar);
+    CREATE INDEX ON pers_person (pin);
+    CREATE INDEX ON pers_attribute_ext (person_id);
+    CREATE INDEX ON park_person (pers_person_pin);
+    CREATE INDEX ON att_person (pers_person_pin);
+"""
+
+# Penanda (COMMENT ON TABLE) bahwa tabel dibuat oleh fixture ini, bukan milik BioSecurity asli
+FIXTURE_MARK = "counting bench fixture"
+
+# Tabel aplikasi dikosongkan supaya siklus pertama benar-benar cold start
+APP_TABLES = ("zone_snapshot", "person_profile", "tracker_state", "zone_event", "occupancy_rollup")
+
+class UnsafeDatabaseError(RuntimeError):
+    pass
+
+
+def check_target(cur):
+    # Tolak database yang tabel BioSecurity-nya berisi data yang tidak dibuat fixture (database asli)
+    for table in FIXTURE_TABLES:
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if not cur.fetchone()[0]:
+            continue
+        cur.execute("SELECT obj_description(%s::regclass, 'pg_class')", (table,))
+        if cur.fetchone()[0] == FIXTURE_MARK:
+            continue
+        cur.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if cur.fetchone()[0]:
+            raise UnsafeDatabaseError(f"Tabel {table} berisi data yang bukan dari fixture benchmark, database ini tidak disentuh")
+
+def seed(dsn, people, nipeg_column, drop_tables=False):
+    # HANYA untuk database benchmark: tabel BioSecurity di atas di-drop lalu diisi data sintetis
+    if not drop_tables:
+        raise UnsafeDatabaseError("Fixture men-drop tabel BioSecurity, jalankan dengan --drop-biosecurity-tables")
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            check_target(cur)
+            cur.execute("DROP TABLE IF EXISTS " + ", ".join(FIXTURE_TABLES))
+            cur.execute(SCHEMA_SQL.format(nipeg=nipeg_column))
+            for table in FIXTURE_TABLES:
+                cur.execute(f"COMMENT ON TABLE {table} IS %s", (FIXTURE_MARK,))
+            cur.execute(
+                "INSERT INTO pers_person (pin, name, gender, email, mobile_phone, birthday) "
+                "SELECT g::text, 'Person ' || g, CASE WHEN g %% 2 = 0 THEN 'M' ELSE 'F' END, "
+                "'p' || g || '@example.com', '08' || g, date '1980-01-01' + g %% 10000 "
+                "FROM generate_series(0, %s - 1) g",
+                (people,),
+            )
+            cur.execute(f"INSERT INTO pers_attribute_ext (person_id, {nipeg_column}) SELECT id, 'NIP' || pin FROM pers_person")
+            cur.execute("INSERT INTO park_person (pers_person_pin) SELECT pin FROM pers_person WHERE id % 4 = 0")
+            cur.execute("INSERT INTO park_car_number (car_number) SELECT 'B ' || g || ' XY' FROM generate_series(1, %s) g", (people,))
+            cur.execute("INSERT INTO acc_person (person_id, disabled) SELECT id, id % 40 = 0 FROM pers_person")
+            cur.executemany(
+                "INSERT INTO att_person (pers_person_pin, pers_person_name, dept_name) VALUES (%s, %s, %s)",
+                [(str(pin), f"Person {pin}", person_dept(pin)) for pin in range(people)],
+            )
+            for table in APP_TABLES:
+                cur.execute("SELECT to_regclass(%s)", (table,))
+                if cur.fetchone()[0]:
+                    cur.execute(f"DELETE FROM {table}")
+    finally:
+        conn.close()
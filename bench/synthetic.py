@@ -0,0 +1,46 @@
+import random, datetime
+
+# Device sama dengan contoh di .env.example, supaya mapping zona tidak perlu diubah
+DEVICES = {
+    "hijau": (["GATE-POS1-IN-1", "GATE-POS1-IN-2", "TRIPOD-POS1-IN-1"], ["GATE-POS1-OUT-1", "GATE-POS1-OUT-2", "TRIPOD-POS1-OUT-1"]),
+    "merah": (["GATE-POS2-IN", "TRIPOD-POS2-IN"], ["GATE-POS2-OUT", "TRIPOD-POS2-OUT"]),
+}
+DEPT_COUNT = 12
+NOISE_EVENTS = ("Global Anti-Passback(logical)", "Disconnected")
+
+def device_env():
+    env = {}
+    for zone, (ins, outs) in DEVICES.items():
+        env[f"IN_DEVICES_{zone.upper()}"] = ",".join(ins)
+        env[f"OUT_DEVICES_{zone.upper()}"] = ",".join(outs)
+    return env
+
+def person_dept(pin):
+    return f"Dept {int(pin) % DEPT_COUNT}"
+
+def make_events(people, events_per_day, day=None, seed=1):
+    # Transaksi satu hari, urut waktu: tiap orang bolak-balik masuk/keluar, ada tap ganda (debounce) dan event noise
+    rng = random.Random(seed)
+    day = day or datetime.date.today()
+    start = datetime.datetime.combine(day, datetime.time.min)
+    seconds = sorted(rng.randrange(86400) for _ in range(events_per_day))
+    inside = {}
+    events = []
+    for i, second in enumerate(seconds):
+        pin = str(rng.randrange(people))
+        zone = "hijau" if int(pin) % 3 else "merah"
+        ins, outs = DEVICES[zone]
+        going_in = not inside.get(pin, False)
+        if rng.random() < 0.1:
+            going_in = not going_in  # tap yang tidak berpasangan
+        inside[pin] = going_in
+        events.append({
+            "id": str(i + 1),
+            "pin": pin,
+            "name": f"Person {pin}",
+            "deptName": person_dept(pin),
+            "devName": rng.choice(ins if going_in else outs),
+            "eventName": rng.choice(NOISE_EVENTS) if rng.random() < 0.02 else "Normal Verify Open",
+            "eventTime": (start + datetime.timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S"),
+        })
+    return events
@@ -1,57 +1,77 @@
 import os
-import psycopg2
+import threading
 import json
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
+from lib.api_tracker import NIPEG_COLUMN
+from lib.stale_cache import StaleCache
 
 # Path absolut ke folder root (di mana .env berada)
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
 load_dotenv(dotenv_path)
 
-class BlacklistTracker:
-    def __init__(self):
-        self.conn = psycopg2.connect(
-            host=os.getenv("DB_HOST", "127.0.0.1"),
-            port=os.getenv("DB_PORT", "5442"),
-            dbname=os.getenv("DB_NAME", "biosecurity-boot"),
-            user=os.getenv("DB_USER", "root"),
-            password=os.getenv("DB_PASSWORD", "ZKTeco##123")
-        )
-
-    def run(self):
-        data = {"data": []}
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute("SELECT * FROM acc_person WHERE disabled = 't'")
-                acc_persons = cur.fetchall()
-
-                for acc in acc_persons:
-                    person_id = acc[17]  # index ke-17 = acc_person.person_id
-
-                    cur.execute("SELECT * FROM pers_person WHERE id = %s", (person_id,))
-                    person = cur.fetchone()
-                    if not person:
-                        continue
+# === Pool koneksi biosecurity, dibuat sekali per proses ===
+_pool = None
+_pool_lock = threading.Lock()
 
-                    cur.execute("SELECT * FROM pers_attribute_ext WHERE person_id = %s", (person[0],))
-                    attribute = cur.fetchone()
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(
+                    1,
+                    int(os.getenv("DB_POOL_SIZE", "5")),
+                    host=os.getenv("DB_HOST", "127.0.0.1"),
+                    port=os.getenv("DB_PORT", "5442"),
+                    dbname=os.getenv("DB_NAME", "biosecurity-boot"),
+                    user=os.getenv("DB_USER", "root"),
+                    password=os.getenv("DB_PASSWORD", "ZKTeco##123")
+                )
+    return _pool
 
-                    cur.execute("SELECT * FROM att_person WHERE pers_person_pin = %s", (person[34],))
-                    attendance = cur.fetchone()
+# Satu query untuk semua orang yang di-disable; kolom diambil by name (dulu pakai index posisi)
+BLACKLIST_SQL = f"""
+    SELECT p.gender, a.nipeg, ap.dept_name, ap.pers_person_name, ap.pers_person_pin
+    FROM acc_person acc
+    JOIN pers_person p ON p.id = acc.person_id
+    LEFT JOIN LATERAL (
+        SELECT {NIPEG_COLUMN} AS nipeg FROM pers_attribute_ext WHERE person_id = p.id LIMIT 1
+    ) a ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT dept_name, pers_person_name, pers_person_pin FROM att_person WHERE pers_person_pin = p.pin LIMIT 1
+    ) ap ON TRUE
+    WHERE acc.disabled = 't'
+"""
 
-                    gender = "Male" if person[19] == "M" else "Female"
-                    nipeg = attribute[19] if attribute and attribute[19] else ""
-                    
+class BlacklistTracker:
+    def fetch(self):
+        data = {"data": []}
+        conn = get_pool().getconn()
+        try:
+            conn.autocommit = True  # hanya SELECT, jangan tinggalkan transaksi terbuka di pool
+            with conn.cursor() as cur:
+                cur.execute(BLACKLIST_SQL)
+                for gender, nipeg, dept, name, pin in cur:
                     data["data"].append({
                         "site": "PT. PLN Indonesia Power",
-                        "dept": attendance[17] if attendance else "",
+                        "dept": dept or "",
                         "foto": "",
-                        "name": attendance[24] if attendance else "",
-                        "time": gender,
-                        "id": attendance[25] if attendance else "",
-                        "nipeg": nipeg
+                        "name": name or "",
+                        "time": "Male" if gender == "M" else "Female",
+                        "id": pin or "",
+                        "nipeg": nipeg or ""
                     })
+        finally:
+            get_pool().putconn(conn, close=bool(conn.closed))
+
+        return data
 
-        except Exception as e:
-            return {"error": str(e)}
+# Hasil blacklist di-cache per proses, di-refresh di background setiap BLACKLIST_TTL_SEC
+blacklist_cache = StaleCache("blacklist", lambda: BlacklistTracker().fetch(), int(os.getenv("BLACKLIST_TTL_SEC", "60")))
 
-        return data
\ No newline at end of file
+def get_blacklist():
+    try:
+        return blacklist_cache.get()
+    except Exception as e:
+        return {"error": str(e)}
@@ -0,0 +1,211 @@
+import io, os, sys, time, asyncio, logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes
+from aiohttp import web
+from lib import metrics, snapshot_store
+from lib.db_pool import close_pool
+from lib.snapshot_cache import snapshot_cache, zone_parts, json_parts, ZoneStream, SSE_RETRY, SSE_KEEPALIVE_SEC, SSE_MAX_SEC
+
+log = logging.getLogger(__name__)
+
+# === Server async (APP_SERVER=aiohttp) ===
+# Route yang sering di-poll dilayani langsung di event loop; halaman lain tetap lewat Flask di thread pool
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", "16"))
+ASYNC_SSE_MAX_CLIENTS = int(os.getenv("ASYNC_SSE_MAX_CLIENTS", "1000"))
+
+ZONE_ROUTES = {"/api/data": "hijau", "/api/merah": "merah"}
+ZONE_NAMES = set(ZONE_ROUTES.values())
+
+# Metric yang sama dengan route Flask (nama sama -> objek yang sama di registry)
+REQUEST_SECONDS = metrics.histogram("counting_http_request_seconds", "Latency request Flask per route", ("route", "method", "status"))
+
+
+class UpdateNotifier:
+    # Jembatan dari publish snapshot (thread worker) ke stream yang menunggu di event loop
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    def notify(self, zone):
+        self.loop.call_soon_threadsafe(self.fire)
+
+    def fire(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+def parts_response(status, headers, body):
+    return web.Response(status=status, headers=headers, body=body)
+
+def wsgi_environ(request, body):
+    host, _, port = (request.host or "localhost").partition(":")
+    environ = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": unquote_to_bytes(request.rel_url.raw_path).decode("latin-1"),
+        "QUERY_STRING": request.rel_url.raw_query_string,
+        "SERVER_NAME": host,
+        "SERVER_PORT": port or ("443" if request.secure else "80"),
+        "SERVER_PROTOCOL": f"HTTP/{request.version.major}.{request.version.minor}",
+        "REMOTE_ADDR": request.remote or "",
+        "CONTENT_TYPE": request.headers.get("Content-Type", ""),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": request.scheme,
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for key, value in request.headers.items():
+        name = "HTTP_" + key.upper().replace("-", "_")
+        if name in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH"):
+            continue
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def call_wsgi(wsgi_app, environ):
+    # Dijalankan di thread pool: seluruh body dikumpulkan (route streaming sudah dilayani async)
+    captured = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"] = status
+        captured["headers"] = headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return captured["status"], captured["headers"], b"".join(chunks)
+
+
+def build_app(wsgi_app):
+    executor = ThreadPoolExecutor(max_workers=ASYNC_WSGI_THREADS, thread_name_prefix="wsgi")
+    sse_clients = 0
+    notifier = None
+
+    @web.middleware
+    async def timing(request, handler):
+        # Route Flask sudah dicatat oleh after_request-nya sendiri
+        if request.match_info.route.name == "flask":
+            return await handler(request)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=status)
+
+    async def wait_for_update(zone, version, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            snapshot = await snapshot_cache.get_async(zone)
+            if snapshot is not None and snapshot.version != version:
+                return snapshot
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            await notifier.wait(min(remaining, snapshot_cache.recheck_sec))
+
+    async def zone_data(request):
+        zone = ZONE_ROUTES[request.path]
+        try:
+            snapshot = await snapshot_cache.get_async(zone)
+        except Exception as e:
+            log.error(f"[ZoneData] Gagal load zone {zone}: {e}")
+            return parts_response(*json_parts({"offline": True, "error": str(e)}))
+        return parts_response(*zone_parts(
+            snapshot, request.query.get("since"), request.query.get("fields"),
+            request.headers.get("If-None-Match", ""), request.headers.get("If-Modified-Since", ""),
+        ))
+
+    async def stream(request):
+        nonlocal sse_clients
+        zone = request.match_info["zone"]
+        if zone not in ZONE_NAMES:
+            raise web.HTTPNotFound()
+        try:
+            fields = snapshot_store.parse_fields(request.query.get("fields"))
+        except ValueError as e:
+            return parts_response(*json_parts({"error": str(e)}, status=400))
+        if sse_clients >= ASYNC_SSE_MAX_CLIENTS:
+            return parts_response(*json_parts({"error": "Terlalu banyak stream aktif"}, status=503))
+
+        zone_stream = ZoneStream(zone, fields, request.headers.get("Last-Event-ID", ""))
+        response = web.StreamResponse(headers=ZoneStream.headers)
+        sse_clients += 1
+        try:
+            await response.prepare(request)
+            await response.write(SSE_RETRY)
+            deadline = time.monotonic() + SSE_MAX_SEC
+            while time.monotonic() < deadline:
+                snapshot = await wait_for_update(zone, zone_stream.version, SSE_KEEPALIVE_SEC)
+                if snapshot is None:
+                    await response.write(zone_stream.status(await snapshot_cache.get_async(zone)))
+                else:
+                    await response.write(zone_stream.update(snapshot))
+        except ConnectionResetError:
+            pass  # client menutup koneksi
+        except Exception as e:
+            log.error(f"[SSE] Stream {zone} berhenti: {e}")
+        finally:
+            sse_clients -= 1
+        return response
+
+    async def metrics_endpoint(request):
+        return web.Response(body=metrics.REGISTRY.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    async def flask(request):
+        body = await request.read()
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(executor, call_wsgi, wsgi_app, wsgi_environ(request, body))
+        code, _, reason = status.partition(" ")
+        response = web.Response(status=int(code), reason=reason or None, body=content)
+        for key, value in headers:
+            if key.lower() != "content-length":
+                response.headers.add(key, value)
+        return response
+
+    async def on_startup(app):
+        nonlocal notifier
+        notifier = UpdateNotifier(asyncio.get_running_loop())
+        snapshot_cache.listeners.append(notifier.notify)
+
+    async def on_cleanup(app):
+        snapshot_cache.listeners.remove(notifier.notify)
+        executor.shutdown(wait=False)
+        await close_pool()
+
+    app = web.Application(middlewares=[timing], client_max_size=16 * 1024 * 1024)
+    for path in ZONE_ROUTES:
+        app.router.add_get(path, zone_data)
+    app.router.add_get("/api/stream/{zone}", stream)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_route("*", "/{tail:.*}", flask, name="flask")
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def run(wsgi_app, host, port):
+    log.info(f"[Server] aiohttp di {host}:{port}")
+    web.run_app(build_app(wsgi_app), host=host, port=port, print=None, access_log=None)
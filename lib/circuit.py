@@ -0,0 +1,89 @@
+import os, time, logging, threading
+from lib import metrics
+
+log = logging.getLogger(__name__)
+
+# === Circuit breaker per upstream (api, dept, add_person) ===
+# Setelah beberapa kali gagal berturut-turut upstream tidak dipanggil dulu (open), jeda berlipat dua tiap gagal lagi.
+# Setelah jeda lewat satu panggilan dicoba (half-open): berhasil -> normal lagi, gagal -> open dengan jeda lebih lama
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", "3"))
+CIRCUIT_OPEN_SEC = float(os.getenv("CIRCUIT_OPEN_SEC", "10"))
+CIRCUIT_MAX_OPEN_SEC = float(os.getenv("CIRCUIT_MAX_OPEN_SEC", "300"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKERS = {}
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failures=CIRCUIT_FAILURES, open_sec=CIRCUIT_OPEN_SEC, max_open_sec=CIRCUIT_MAX_OPEN_SEC):
+        self.name = name
+        self.max_failures = failures
+        self.base_open_sec = open_sec
+        self.max_open_sec = max_open_sec
+        self.state = CLOSED
+        self.failures = 0
+        self.open_sec = open_sec
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        # True kalau upstream boleh dipanggil sekarang; saat half-open hanya satu pemanggil (probe) yang lolos
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now >= self.retry_at:
+                # Probe yang tidak pernah melapor hasilnya tidak mengunci breaker selamanya
+                self.state = HALF_OPEN
+                self.retry_at = now + self.open_sec
+                log.info(f"[Circuit] {self.name} half-open, coba satu panggilan")
+                return True
+        REJECTED.inc(upstream=self.name)
+        return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} sedang tidak tersedia, coba lagi dalam {self.retry_in():.0f} detik")
+
+    def success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                log.info(f"[Circuit] {self.name} pulih, kembali normal")
+            self.state = CLOSED
+            self.failures = 0
+            self.open_sec = self.base_open_sec
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # Probe gagal: buka lagi dengan jeda dua kali lipat
+                self.open_sec = min(self.open_sec * 2, self.max_open_sec)
+            elif self.state == CLOSED and self.failures < self.max_failures:
+                return
+            self.state = OPEN
+            self.retry_at = time.monotonic() + self.open_sec
+            log.warning(f"[Circuit] {self.name} open setelah {self.failures} kegagalan, dicoba lagi dalam {self.open_sec:.0f} detik")
+
+    def retry_in(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return 0.0
+            return max(0.0, self.retry_at - time.monotonic())
+
+
+def breaker(name):
+    # Satu breaker per upstream untuk seluruh proses
+    return BREAKERS.setdefault(name, CircuitBreaker(name))
+
+def breaker_states():
+    return {(name,): STATE_VALUES[b.state] for name, b in list(BREAKERS.items())}
+
+REJECTED = metrics.counter("counting_circuit_rejected_total", "Panggilan upstream yang ditolak karena circuit open", ("upstream",))
+metrics.gauge("counting_circuit_state", "State circuit upstream (0 closed, 1 half-open, 2 open)", ("upstream",),
+              collect=breaker_states)
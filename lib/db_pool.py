@@ -0,0 +1,44 @@
+import os, asyncio, asyncpg
+from lib import metrics
+from dotenv import load_dotenv
+
+dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
+load_dotenv(dotenv_path)
+
+# Pool asyncpg dibuat sekali per event loop (worker, server async), bukan per siklus.
+# Pool asyncpg terikat ke loop yang membuatnya, jadi tiap loop punya pool sendiri
+_pools = {}
+
+async def get_pool():
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            dsn=os.getenv("DATABASE_URL"),
+            min_size=1,
+            max_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_inactive_connection_lifetime=int(os.getenv("DB_POOL_RECYCLE_SEC", "1800")),
+        )
+        existing = _pools.setdefault(loop, pool)
+        if existing is not pool:
+            await pool.close()  # coroutine lain sudah lebih dulu membuat pool
+            pool = existing
+    return pool
+
+def pool_usage():
+    used = idle = size_max = 0
+    for pool in list(_pools.values()):
+        size, pool_idle = pool.get_size(), pool.get_idle_size()
+        used += size - pool_idle
+        idle += pool_idle
+        size_max += pool.get_max_size()
+    if not _pools:
+        return {}
+    return {("asyncpg", "used"): used, ("asyncpg", "idle"): idle, ("asyncpg", "max"): size_max}
+
+metrics.gauge("counting_db_pool_connections", "Koneksi pool database", ("pool", "state"), collect=pool_usage)
+
+async def close_pool():
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
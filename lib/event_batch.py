@@ -0,0 +1,170 @@
+import os, datetime
+from lib.event_feed import IGNORED_EVENTS, timestamp_from_str, dispatch_events
+from lib.occupancy import PersonState, DEBOUNCE_SEC
+
+try:
+    import numpy as np
+except ImportError:  # NumPy opsional: tanpa NumPy jalur batch tetap dipakai, hanya tanpa array
+    np = None
+
+# Batch kecil (siklus biasa) lebih cepat diproses satu per satu lewat dispatch_events
+BATCH_MIN_EVENTS = int(os.getenv("BATCH_MIN_EVENTS", "500"))
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DEV_IN, DEV_OUT = 1, 2
+
+class EventColumns:
+    # Event yang lolos filter (sama dengan parse_event) dalam bentuk kolom, urutan asli dipertahankan
+    __slots__ = ("pin", "dept", "name", "dev", "ts", "time")
+
+    def __init__(self, events):
+        pins = [e.get("pin", "").strip() for e in events]
+        depts = [e.get("deptName", "").strip() for e in events]
+        devs = [e.get("devName", "").strip() for e in events]
+        times = [e.get("eventTime", "").strip() for e in events]
+
+        keep = [
+            i for i, e in enumerate(events)
+            if pins[i] and depts[i] and devs[i] and times[i]
+            and e.get("eventName", "").strip() not in IGNORED_EVENTS
+        ]
+        stamps = parse_timestamps({times[i] for i in keep})
+        keep = [i for i in keep if stamps[times[i]]]
+
+        self.pin = [pins[i] for i in keep]
+        self.dept = [depts[i] for i in keep]
+        self.name = [events[i].get("name", "").strip() for i in keep]
+        self.dev = [devs[i] for i in keep]
+        self.time = [times[i] for i in keep]
+        self.ts = [stamps[t] for t in self.time]
+
+    def __len__(self):
+        return len(self.pin)
+
+
+def is_regular(time_str):
+    # Persis "YYYY-MM-DD HH:MM:SS", format lain tetap lewat strptime
+    return (len(time_str) == 19 and time_str[4] == time_str[7] == '-' and time_str[10] == ' '
+            and time_str[13] == time_str[16] == ':')
+
+def local_offset(hour):
+    # Selisih jam lokal terhadap UTC untuk satu jam "YYYY-MM-DD HH"
+    naive = datetime.datetime.fromisoformat(hour + ":00:00")
+    return int((naive - EPOCH).total_seconds()) - int(naive.timestamp())
+
+def parse_timestamps(time_strs):
+    # Parse sekali per eventTime unik; hasil {eventTime: epoch detik atau None}, sama dengan timestamp_from_str
+    stamps = {}
+    regular = [t for t in time_strs if is_regular(t)]
+    if np is not None and regular:
+        try:
+            naive = np.array(regular, dtype="datetime64[s]").astype(np.int64).tolist()
+        except ValueError:
+            naive = None
+        if naive is not None:
+            offsets = {}
+            for t, value in zip(regular, naive):
+                hour = t[:13]
+                if hour not in offsets:
+                    offsets[hour] = local_offset(hour)
+                stamps[t] = value - offsets[hour]
+    else:
+        for t in regular:
+            try:
+                stamps[t] = int(datetime.datetime.fromisoformat(t).timestamp())
+            except ValueError:
+                stamps[t] = None
+
+    for t in time_strs:
+        if t not in stamps:
+            stamps[t] = timestamp_from_str(t)
+    return stamps
+
+def device_codes(tracker, devs):
+    # Kode in/out per event untuk satu zona, lookup dihitung sekali per nama device unik
+    lookup = {}
+    for dev in set(devs):
+        key = dev.lower()
+        lookup[dev] = (DEV_IN if key in tracker.in_devices else 0) | (DEV_OUT if key in tracker.out_devices else 0)
+    if np is not None:
+        unique, inverse = np.unique(np.array(devs), return_inverse=True)
+        return np.array([lookup[dev] for dev in unique.tolist()], dtype=np.int8)[inverse]
+    return [lookup[dev] for dev in devs]
+
+def pin_groups(pins, codes):
+    # Index event per pin (hanya device milik zona ini), urutan waktu di dalam pin tetap
+    if np is not None:
+        selected = np.flatnonzero(codes)
+        if not len(selected):
+            return []
+        _, pin_codes = np.unique(np.array(pins)[selected], return_inverse=True)
+        order = np.argsort(pin_codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(pin_codes[order])) + 1
+        return [group.tolist() for group in np.split(selected[order], bounds)]
+
+    groups = {}
+    for i, code in enumerate(codes):
+        if code:
+            groups.setdefault(pins[i], []).append(i)
+    return list(groups.values())
+
+def apply_pin(engine, columns, codes, indexes, accepted):
+    # Debounce + perpindahan in/out untuk satu pin, logika sama dengan OccupancyEngine.apply
+    first = indexes[0]
+    pin = columns.pin[first]
+    person = engine.persons.get(pin)
+    if person is None:
+        person = engine.persons[pin] = PersonState(columns.dept[first], columns.name[first])
+
+    inside, last_in, last_out = person.inside, person.last_in, person.last_out
+    for i in indexes:
+        ts = columns.ts[i]
+        code = codes[i]
+        if code & DEV_IN and abs(ts - last_in) > DEBOUNCE_SEC:
+            last_in = ts
+            if not inside:
+                inside = True
+                person.in_count += 1
+                person.last_time = columns.time[i]
+                accepted.append((i, 'in'))
+        if code & DEV_OUT and abs(ts - last_out) > DEBOUNCE_SEC:
+            last_out = ts
+            if inside:
+                inside = False
+                person.out_count += 1
+                person.last_time = columns.time[i]
+                accepted.append((i, 'out'))
+    person.inside, person.last_in, person.last_out = inside, last_in, last_out
+
+def dispatch_batch(events, trackers):
+    # Sama dengan dispatch_events, tapi parse dan routing dikerjakan per kolom untuk batch besar
+    trackers = list(trackers)
+    if len(events) < BATCH_MIN_EVENTS:
+        dispatch_events(events, trackers)
+        return
+
+    columns = EventColumns(events)
+    if not len(columns):
+        return
+
+    for tracker in trackers:
+        codes = device_codes(tracker, columns.dev)
+        groups = pin_groups(columns.pin, codes)
+        if not groups:
+            continue
+        if np is not None:
+            codes = codes.tolist()
+
+        accepted = []
+        for indexes in groups:
+            apply_pin(tracker.engine, columns, codes, indexes, accepted)
+
+        # Urutkan lagi sesuai urutan event supaya zone_event/rollup sama dengan jalur satu per satu
+        accepted.sort(key=lambda item: item[0])
+        persons = tracker.engine.persons
+        for i, ev_type in accepted:
+            pin = columns.pin[i]
+            tracker.pending_events.append(
+                (pin, persons[pin].dept, columns.dev[i], ev_type, datetime.datetime.fromtimestamp(columns.ts[i]))
+            )
+        tracker.dirty = True
@@ -0,0 +1,264 @@
+import os, re, time, asyncio, datetime, aiohttp, logging
+from urllib.parse import quote
+from dotenv import load_dotenv
+from lib import jsonfast, circuit
+
+dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
+load_dotenv(dotenv_path)
+
+log = logging.getLogger(__name__)
+
+IGNORED_EVENTS = {'Global Anti-Passback(logical)', 'Disconnected'}
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Cek cepat bentuk eventTime sebelum dipakai sebagai cursor (strptime hanya untuk kandidat cursor)
+TIME_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+# Jendela overlap (detik) saat fetch incremental, untuk event yang telat masuk ke server
+FETCH_OVERLAP_SEC = int(os.getenv("FETCH_OVERLAP_SEC", "120"))
+
+# === Fetch halaman API ===
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "800"))
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "4"))
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))
+API_RETRY_BACKOFF_SEC = float(os.getenv("API_RETRY_BACKOFF_SEC", "1"))
+
+def timestamp_from_str(time_str):
+    try:
+        return int(datetime.datetime.strptime(time_str, TIME_FORMAT).timestamp())
+    except Exception:
+        return None
+
+def parse_event(e):
+    dept = e.get("deptName", "").strip()
+    pin = e.get("pin", "").strip()
+    dev = e.get("devName", "").strip()
+    time_str = e.get("eventTime", "").strip()
+    name = e.get("name", "").strip()
+    event_name = e.get("eventName", "").strip()
+
+    if not all([dept, pin, dev, time_str]):
+        return None
+    if event_name in IGNORED_EVENTS:
+        return None
+
+    ts = timestamp_from_str(time_str)
+    if not ts:
+        return None
+
+    return pin, dept, name, dev, ts, time_str
+
+def dispatch_events(events, trackers):
+    # Satu kali parse per event, lalu dibagikan ke zona yang punya device tersebut
+    routes = {}
+    for tracker in trackers:
+        for dev in tracker.in_devices:
+            routes.setdefault(dev, []).append((tracker, 'in'))
+        for dev in tracker.out_devices:
+            routes.setdefault(dev, []).append((tracker, 'out'))
+
+    for e in events:
+        parsed = parse_event(e)
+        if not parsed:
+            continue
+        pin, dept, name, dev, ts, time_str = parsed
+        for tracker, ev_type in routes.get(dev.lower(), ()):
+            if tracker.engine.apply(pin, dept, name, ev_type, ts, time_str):
+                # Perpindahan status yang sah, nanti disimpan ke tabel zone_event
+                person_dept = tracker.engine.persons[pin].dept
+                tracker.pending_events.append((pin, person_dept, dev, ev_type, datetime.datetime.fromtimestamp(ts)))
+            tracker.dirty = True
+
+class EventFeed:
+    # Ambil transaksi dari API_URL satu kali per siklus untuk semua zona
+    def __init__(self):
+        self.api_url = os.getenv("API_URL")
+        self.access_token = os.getenv("ACCESS_TOKEN")
+
+        self.api_offline = False
+        self.circuit = circuit.breaker("api")
+        self.session = None
+        self.stats = {}             # angka siklus terakhir: pages, events, parse_sec (untuk /metrics)
+
+        # === Cursor incremental (per hari) ===
+        self.cursor_day = None
+        self.cursor_time = None     # eventTime terbaru yang sudah diambil
+        self.seen_keys = {}         # key event -> eventTime, hanya di dalam jendela overlap
+
+    @staticmethod
+    def event_key(e):
+        if e.get("id"):
+            return str(e["id"])
+        return "|".join(str(e.get(k, "")).strip() for k in ("pin", "devName", "eventTime", "eventName"))
+
+    def reset_cursor(self, day):
+        self.cursor_day = day
+        self.cursor_time = None
+        self.seen_keys = {}
+
+    def window_start(self):
+        midnight = datetime.datetime.combine(self.cursor_day, datetime.time.min)
+        if not self.cursor_time:
+            return midnight.strftime(TIME_FORMAT)
+        start = datetime.datetime.strptime(self.cursor_time, TIME_FORMAT) - datetime.timedelta(seconds=FETCH_OVERLAP_SEC)
+        return max(start, midnight).strftime(TIME_FORMAT)
+
+    def get_session(self):
+        # Satu session + connection pool dipakai ulang untuk semua halaman dan semua siklus
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=60),
+                connector=aiohttp.TCPConnector(limit=API_CONCURRENCY, ssl=False),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def fetch_page(self, session, page, start_time):
+        tomorrow = (datetime.datetime.now() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+        url = (
+            f"{self.api_url}?endDate={tomorrow}%2023%3A59%3A59"
+            f"&pageNo={page}&pageSize={API_PAGE_SIZE}&startDate={quote(start_time)}"
+            f"&access_token={self.access_token}"
+        )
+
+        for attempt in range(1, API_RETRIES + 1):
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        raw = await resp.read()
+                        started = time.perf_counter()
+                        body = jsonfast.loads(raw)
+                        self.stats["parse_sec"] += time.perf_counter() - started
+                        self.stats["pages"] += 1
+                        return body
+                    log.warning(f"[API] Page {page} status {resp.status} (attempt {attempt}/{API_RETRIES})")
+            except Exception as e:
+                log.error(f"[API] Failed to fetch page {page} (attempt {attempt}/{API_RETRIES}): {e}")
+
+            if self.api_offline:
+                break  # halaman lain sudah gagal total, siklus ini tetap dibatalkan
+            if attempt < API_RETRIES:
+                await asyncio.sleep(API_RETRY_BACKOFF_SEC * 2 ** (attempt - 1))
+
+        self.api_offline = True
+        return None
+
+    async def fetch_pages(self, session, pages, start_time, semaphore):
+        async def fetch(page):
+            async with semaphore:
+                if self.api_offline:
+                    return None  # jangan lanjut antre ke API yang sudah gagal
+                return await self.fetch_page(session, page, start_time)
+
+        bodies = await asyncio.gather(*(fetch(page) for page in pages))
+        if any(body is None for body in bodies):
+            return None
+        return [body.get("data") or [] for body in bodies]
+
+    async def gather_events(self):
+        start_time = self.window_start()
+        session = self.get_session()
+        semaphore = asyncio.Semaphore(API_CONCURRENCY)
+
+        first = await self.fetch_page(session, 1, start_time)
+        if first is None:
+            self.api_offline = True
+            return []
+
+        events = list(first.get("data") or [])
+        if events:
+            total = first.get("total")
+            if isinstance(total, int):
+                # Jumlah total diketahui: semua halaman sisa diambil paralel
+                last_page = -(-total // API_PAGE_SIZE)
+                pages = await self.fetch_pages(session, range(2, last_page + 1), start_time, semaphore)
+                if pages is None:
+                    self.api_offline = True
+                    return []
+                for page_data in pages:
+                    events.extend(page_data)
+            else:
+                # Total tidak ada: prefetch beberapa halaman sekaligus sampai ketemu halaman kosong
+                page = 2
+                while True:
+                    pages = await self.fetch_pages(session, range(page, page + API_CONCURRENCY), start_time, semaphore)
+                    if pages is None:
+                        self.api_offline = True
+                        return []
+                    for page_data in pages:
+                        events.extend(page_data)
+                    if any(not page_data for page_data in pages):
+                        break
+                    page += API_CONCURRENCY
+
+        started = time.perf_counter()
+        new_events = self.take_new_events(events)
+        self.stats["parse_sec"] += time.perf_counter() - started
+        self.stats["events"] = len(new_events)
+        return new_events
+
+    def take_new_events(self, events):
+        # Buang event yang sudah pernah diambil (jendela overlap), cursor maju ke eventTime terbaru
+        new_events = []
+        for e in events:
+            time_str = str(e.get("eventTime", "")).strip()
+            if not TIME_PATTERN.fullmatch(time_str):
+                continue  # eventTime rusak tidak boleh jadi cursor (strptime di window_start akan gagal terus)
+            key = self.event_key(e)
+            if key in self.seen_keys:
+                continue
+            newer = not self.cursor_time or time_str > self.cursor_time
+            if newer and timestamp_from_str(time_str) is None:
+                continue
+            self.seen_keys[key] = time_str
+            new_events.append(e)
+            if newer:
+                self.cursor_time = time_str
+
+        if self.cursor_time:
+            horizon = (
+                datetime.datetime.strptime(self.cursor_time, TIME_FORMAT)
+                - datetime.timedelta(seconds=FETCH_OVERLAP_SEC)
+            ).strftime(TIME_FORMAT)
+            self.seen_keys = {k: t for k, t in self.seen_keys.items() if t >= horizon}
+
+        new_events.sort(key=lambda e: str(e.get("eventTime", "")).strip())
+        return new_events
+
+    def snapshot(self):
+        return {"cursor_time": self.cursor_time, "seen_keys": self.seen_keys}
+
+    def restore(self, state, day):
+        self.reset_cursor(day)
+        cursor_time = state.get("cursor_time")
+        # State lama dengan cursor rusak: mulai lagi dari 00:00 daripada macet sampai ganti hari
+        self.cursor_time = cursor_time if cursor_time and timestamp_from_str(cursor_time) is not None else None
+        self.seen_keys = dict(state.get("seen_keys") or {})
+
+    async def run(self):
+        today = datetime.date.today()
+        if self.cursor_day != today:
+            # Ganti hari (atau start pertama): mulai lagi dari 00:00
+            self.reset_cursor(today)
+
+        self.api_offline = False
+        self.stats = {"pages": 0, "events": 0, "parse_sec": 0.0, "skipped": False}
+        if not self.circuit.allow():
+            # API sedang bermasalah: jangan download ulang, snapshot lama tetap dipakai sampai jeda breaker lewat
+            self.api_offline = True
+            self.stats["skipped"] = True
+            return []
+
+        try:
+            events = await self.gather_events()
+        except BaseException:
+            self.circuit.failure()
+            raise
+        if self.api_offline:
+            self.circuit.failure()
+        else:
+            self.circuit.success()
+        return events
@@ -0,0 +1,103 @@
+import datetime
+from sqlalchemy import text
+from models.models import get_session
+
+# === Simpan event (worker, asyncpg) ===
+STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS zone_event_stage (
+        zone text, pin text, dept text, device text, ev_type text, ts timestamp
+    ) ON COMMIT DELETE ROWS
+"""
+EVENT_COLUMNS = ["zone", "pin", "dept", "device", "ev_type", "ts"]
+
+async def store_events(conn, records):
+    # COPY ke tabel sementara lalu INSERT .. ON CONFLICT, jadi aman kalau event yang sama tersimpan dua kali.
+    # Harus dipanggil di dalam transaksi; hasilnya key (zone, pin, ev_type, ts) yang benar-benar baru
+    if not records:
+        return set()
+    await conn.execute(STAGE_SQL)
+    await conn.copy_records_to_table("zone_event_stage", records=records, columns=EVENT_COLUMNS)
+    rows = await conn.fetch(
+        "INSERT INTO zone_event (zone, pin, dept, device, ev_type, ts) "
+        "SELECT zone, pin, dept, device, ev_type, ts FROM zone_event_stage "
+        "ON CONFLICT ON CONSTRAINT uq_zone_event DO NOTHING "
+        "RETURNING zone, pin, ev_type, ts"
+    )
+    return {tuple(row) for row in rows}
+
+# === Analitik (Flask, SQLAlchemy) ===
+# Jumlah orang di dalam dihitung dari running sum +1/-1 sejak 00:00 di hari yang sama
+OCCUPANCY_SQL = text("""
+    WITH running AS (
+        SELECT ts, SUM(CASE WHEN ev_type = 'in' THEN 1 ELSE -1 END)
+                   OVER (PARTITION BY date_trunc('day', ts) ORDER BY ts, id ROWS UNBOUNDED PRECEDING) AS cur
+        FROM zone_event
+        WHERE zone = :zone AND ts >= date_trunc('day', CAST(:start AS timestamp)) AND ts < :end
+    )
+    SELECT to_timestamp(floor(extract(epoch FROM ts) / :bucket) * :bucket) AT TIME ZONE 'UTC' AS bucket,
+           MAX(cur) AS peak,
+           (array_agg(cur ORDER BY ts DESC))[1] AS cur
+    FROM running
+    WHERE ts >= :start
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+HOURLY_SQL = text("""
+    SELECT date_trunc('hour', ts) AS hour,
+           COUNT(*) FILTER (WHERE ev_type = 'in') AS total_in,
+           COUNT(*) FILTER (WHERE ev_type = 'out') AS total_out
+    FROM zone_event
+    WHERE zone = :zone AND ts >= :start AND ts < :end
+    GROUP BY 1
+    ORDER BY 1
+""")
+
+DEPT_PEAK_SQL = text("""
+    WITH running AS (
+        SELECT dept, ts, ev_type,
+               SUM(CASE WHEN ev_type = 'in' THEN 1 ELSE -1 END)
+                   OVER (PARTITION BY dept, date_trunc('day', ts) ORDER BY ts, id ROWS UNBOUNDED PRECEDING) AS cur
+        FROM zone_event
+        WHERE zone = :zone AND ts >= date_trunc('day', CAST(:start AS timestamp)) AND ts < :end
+    ), ranked AS (
+        SELECT dept, cur, ts,
+               ROW_NUMBER() OVER (PARTITION BY dept ORDER BY cur DESC, ts) AS rn,
+               COUNT(*) FILTER (WHERE ev_type = 'in') OVER (PARTITION BY dept) AS total_in,
+               COUNT(*) FILTER (WHERE ev_type = 'out') OVER (PARTITION BY dept) AS total_out
+        FROM running
+        WHERE ts >= :start
+    )
+    SELECT dept, cur AS peak, ts AS peak_at, total_in, total_out
+    FROM ranked
+    WHERE rn = 1
+    ORDER BY peak DESC, dept
+""")
+
+def _query(sql, **params):
+    with get_session() as session:
+        return [dict(row._mapping) for row in session.execute(sql, params)]
+
+def occupancy_over_time(zone, start, end, bucket_sec=900):
+    rows = _query(OCCUPANCY_SQL, zone=zone, start=start, end=end, bucket=bucket_sec)
+    return [{"time": r["bucket"].isoformat(), "cur": r["cur"], "peak": r["peak"]} for r in rows]
+
+def hourly_counts(zone, start, end):
+    rows = _query(HOURLY_SQL, zone=zone, start=start, end=end)
+    return [{"hour": r["hour"].isoformat(), "in": r["total_in"], "out": r["total_out"]} for r in rows]
+
+def dept_peaks(zone, start, end):
+    rows = _query(DEPT_PEAK_SQL, zone=zone, start=start, end=end)
+    return [
+        {"dept": r["dept"], "peak": r["peak"], "peak_at": r["peak_at"].isoformat(), "in": r["total_in"], "out": r["total_out"]}
+        for r in rows
+    ]
+
+def parse_range(start, end):
+    # Default: hari ini dari 00:00 sampai sekarang; format ISO (YYYY-MM-DD atau YYYY-MM-DDTHH:MM:SS)
+    today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+    start = datetime.datetime.fromisoformat(start) if start else today
+    end = datetime.datetime.fromisoformat(end) if end else datetime.datetime.now() + datetime.timedelta(seconds=1)
+    if end <= start:
+        raise ValueError("end harus lebih besar dari start")
+    return start, end
@@ -0,0 +1,33 @@
+import os, json
+
+try:
+    import orjson
+except ImportError:  # orjson opsional: tanpa orjson pakai json bawaan
+    orjson = None
+
+# auto = orjson kalau terpasang, stdlib = paksa json bawaan
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+if JSON_BACKEND not in ("auto", "orjson", "stdlib"):
+    raise ValueError(f"JSON_BACKEND tidak valid: {JSON_BACKEND}")
+if JSON_BACKEND == "orjson" and orjson is None:
+    raise ImportError("JSON_BACKEND=orjson tapi orjson belum terpasang")
+USE_ORJSON = orjson is not None and JSON_BACKEND != "stdlib"
+
+BACKEND = "orjson" if USE_ORJSON else "stdlib"
+
+def dumps(obj, default=str, sort_keys=False):
+    # Hasilnya selalu bytes UTF-8 (tanpa spasi), siap dikirim atau disimpan
+    if USE_ORJSON:
+        # datetime tetap lewat `default` supaya formatnya sama dengan json bawaan
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(
+        obj, default=default, sort_keys=sort_keys, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def loads(data):
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,53 @@
+import os, zlib, asyncpg, logging
+from dotenv import load_dotenv
+
+dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
+load_dotenv(dotenv_path)
+
+log = logging.getLogger(__name__)
+
+def lock_key(zone):
+    # Key advisory lock tetap untuk satu zona, sama di semua proses/mesin
+    return zlib.crc32(f"counting-worker:{zone}".encode("utf-8"))
+
+class LeaderLock:
+    # Advisory lock Postgres per zona di satu koneksi khusus (bukan dari pool, supaya lock tidak ikut di-recycle).
+    # Kalau koneksi putus, Postgres otomatis melepas lock dan worker lain bisa mengambil alih
+    def __init__(self, dsn=None):
+        self.dsn = dsn or os.getenv("DATABASE_URL")
+        self.conn = None
+        self.held = set()
+
+    async def connection(self):
+        if self.conn is not None and not self.conn.is_closed():
+            try:
+                await self.conn.fetchval("SELECT 1")
+                return self.conn
+            except Exception as e:
+                log.warning(f"[Leader] Koneksi lock putus, semua zona dilepas: {e}")
+                self.conn.terminate()
+        self.conn = None
+        self.held = set()
+        self.conn = await asyncpg.connect(dsn=self.dsn)
+        return self.conn
+
+    async def acquire(self, zones):
+        # Coba ambil lock zona yang belum dipegang; hasilnya zona yang sekarang dipimpin proses ini
+        try:
+            conn = await self.connection()
+            for zone in sorted(set(zones) - self.held):
+                if await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_key(zone)):
+                    self.held.add(zone)
+        except Exception as e:
+            log.error(f"[Leader] Gagal mengambil lock: {e}")
+            await self.release()
+        return set(self.held)
+
+    async def release(self):
+        conn, self.conn = self.conn, None
+        self.held = set()
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
@@ -0,0 +1,69 @@
+DEBOUNCE_SEC = 60
+
+class PersonState:
+    __slots__ = ("dept", "name", "inside", "last_in", "last_out", "last_time", "in_count", "out_count")
+
+    def __init__(self, dept, name, inside=False, last_in=0, last_out=0, last_time='', in_count=0, out_count=0):
+        self.dept = dept
+        self.name = name
+        self.inside = inside
+        self.last_in = last_in
+        self.last_out = last_out
+        self.last_time = last_time
+        self.in_count = in_count
+        self.out_count = out_count
+
+    def to_row(self):
+        return [self.dept, self.name, int(self.inside), self.last_in, self.last_out,
+                self.last_time, self.in_count, self.out_count]
+
+    @classmethod
+    def from_row(cls, row):
+        dept, name, inside, last_in, last_out, last_time, in_count, out_count = row
+        return cls(dept, name, bool(inside), last_in, last_out, last_time, in_count, out_count)
+
+
+class OccupancyEngine:
+    # State masuk/keluar per orang untuk satu hari, di-update hanya dengan event baru
+    def __init__(self):
+        self.day = None
+        self.persons = {}
+
+    def reset(self, day):
+        self.day = day
+        self.persons = {}
+
+    def apply(self, pin, dept, name, ev_type, ts, time_str):
+        person = self.persons.get(pin)
+        if person is None:
+            person = self.persons[pin] = PersonState(dept, name)
+
+        if ev_type == 'in':
+            if abs(ts - person.last_in) <= DEBOUNCE_SEC:
+                return False
+            person.last_in = ts
+            if person.inside:
+                return False
+            person.inside = True
+            person.in_count += 1
+        else:
+            if abs(ts - person.last_out) <= DEBOUNCE_SEC:
+                return False
+            person.last_out = ts
+            if not person.inside:
+                return False
+            person.inside = False
+            person.out_count += 1
+
+        person.last_time = time_str
+        return True
+
+    def snapshot(self):
+        return {
+            "day": self.day.isoformat() if self.day else None,
+            "persons": {pin: p.to_row() for pin, p in self.persons.items()},
+        }
+
+    def restore(self, data, day):
+        self.reset(day)
+        self.persons = {pin: PersonState.from_row(row) for pin, row in data.get("persons", {}).items()}
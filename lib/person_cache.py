@@ -0,0 +1,61 @@
+import os, time, threading
+from lib import metrics
+from collections import OrderedDict
+
+PERSON_CACHE_SIZE = int(os.getenv("PERSON_CACHE_SIZE", "5000"))
+PERSON_CACHE_TTL_SEC = int(os.getenv("PERSON_CACHE_TTL_SEC", "600"))
+PERSON_CACHE_NEGATIVE_TTL_SEC = int(os.getenv("PERSON_CACHE_NEGATIVE_TTL_SEC", "60"))
+
+class PersonCache:
+    # LRU + TTL untuk detail orang (gender, email, plat, nipeg, ...), dipakai semua zona di proses worker.
+    # Pin yang belum ada di database (mis. baru registrasi) di-cache kosong hanya selama negative_ttl
+    def __init__(self, max_size=PERSON_CACHE_SIZE, ttl=PERSON_CACHE_TTL_SEC, negative_ttl=PERSON_CACHE_NEGATIVE_TTL_SEC):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pin):
+        # Hasil: dict detail, {} kalau pin tidak ada di database, None kalau belum di-cache
+        with self.lock:
+            item = self.items.get(pin)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self.items[pin]
+                self.misses += 1
+                return None
+            self.items.move_to_end(pin)
+            self.hits += 1
+            return item[1]
+
+    def set(self, pin, detail):
+        ttl = self.ttl if detail else self.negative_ttl
+        with self.lock:
+            self.items[pin] = (time.monotonic() + ttl, detail)
+            self.items.move_to_end(pin)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+person_cache = PersonCache()
+
+metrics.counter("counting_person_cache_requests_total", "Lookup detail orang ke cache", ("result",),
+                collect=lambda: {("hit",): person_cache.hits, ("miss",): person_cache.misses})
+metrics.gauge("counting_person_cache_entries", "Jumlah pin di cache detail orang",
+              collect=lambda: {(): len(person_cache.items)})
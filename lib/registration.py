@@ -0,0 +1,87 @@
+import io, os, time, uuid, base64, logging, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from lib import circuit
+
+log = logging.getLogger(__name__)
+
+PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(8 * 1024 * 1024)))
+PHOTO_MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "640"))
+PHOTO_JPEG_QUALITY = int(os.getenv("PHOTO_JPEG_QUALITY", "85"))
+REGISTER_WORKERS = int(os.getenv("REGISTER_WORKERS", "2"))
+REGISTER_JOBS_KEPT = 500
+
+def prepare_photo(raw):
+    # Validasi + kecilkan foto di memori, hasilnya base64 siap kirim ke URL_ADD_PERSON
+    if not raw or len(raw) > PHOTO_MAX_BYTES:
+        raise ValueError("Ukuran foto tidak valid")
+    if not (raw.startswith(b"\xff\xd8\xff") or raw.startswith(b"\x89PNG\r\n\x1a\n")):
+        raise ValueError("File tidak valid. Harus .jpg atau .png")
+
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            # Foto HP sering disimpan miring + tag Orientation; putar dulu karena tag hilang saat re-encode
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=PHOTO_JPEG_QUALITY, optimize=True)
+            raw = out.getvalue()
+    except Exception as e:
+        raise ValueError("Foto tidak bisa dibaca") from e
+
+    return base64.b64encode(raw).decode("utf-8")
+
+
+class RegistrationQueue:
+    # Kirim registrasi ke API di thread terpisah supaya thread waitress tidak menunggu
+    def __init__(self, session, add_url, access_token, workers=REGISTER_WORKERS):
+        self.session = session
+        self.add_url = add_url
+        self.access_token = access_token
+        self.circuit = circuit.breaker("add_person")
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="register")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, payload):
+        job_id = uuid.uuid4().hex
+        self._set(job_id, "queued", "Registrasi sedang diproses")
+        self.executor.submit(self._send, job_id, payload)
+        return job_id
+
+    def status(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _set(self, job_id, status, message):
+        with self.lock:
+            self.jobs[job_id] = {"status": status, "message": message, "updated": time.time()}
+            self.jobs.move_to_end(job_id)
+            while len(self.jobs) > REGISTER_JOBS_KEPT:
+                self.jobs.popitem(last=False)
+
+    def _send(self, job_id, payload):
+        if not self.circuit.allow():
+            # API pendaftaran sedang down: langsung gagal, jangan tambah antrean timeout 10 detik
+            self._set(job_id, "failed", f"API pendaftaran sedang tidak tersedia, coba lagi dalam {self.circuit.retry_in():.0f} detik")
+            return
+
+        self._set(job_id, "processing", "Registrasi sedang diproses")
+        try:
+            url = f"{self.add_url}?access_token={self.access_token}"
+            headers = {"Accept": "application/json", "Content-Type": "application/json"}
+            response = self.session.post(url, headers=headers, json=payload, verify=False, timeout=10)
+            result = response.json()
+            # Ada jawaban JSON berarti upstream hidup, walaupun registrasinya ditolak
+            self.circuit.success()
+
+            if result.get("message") == "success":
+                self._set(job_id, "success", "Registrasi berhasil!")
+            else:
+                msg = result.get("message", "Unknown error")
+                self._set(job_id, "failed", f"Gagal registrasi: {msg}")
+        except Exception as e:
+            self.circuit.failure()
+            self._set(job_id, "failed", "Gagal menghubungi API pendaftaran")
+            log.error(f"[Register] Error: {e}")
@@ -0,0 +1,113 @@
+import sys, asyncio, datetime
+from sqlalchemy import text
+from models.models import get_session
+from lib.db_pool import get_pool, close_pool
+
+# Ukuran bucket rollup dalam detik: 1 menit, 15 menit, 1 jam
+BUCKET_SIZES = (60, 900, 3600)
+TOTAL = ''  # baris dept kosong = total satu zona
+
+UPSERT_SQL = """
+    INSERT INTO occupancy_rollup AS r (zone, bucket_sec, bucket_start, dept, ins, outs, cur, peak)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+    ON CONFLICT (zone, bucket_sec, bucket_start, dept) DO UPDATE
+    SET ins = r.ins + EXCLUDED.ins,
+        outs = r.outs + EXCLUDED.outs,
+        cur = EXCLUDED.cur,
+        peak = GREATEST(r.peak, EXCLUDED.peak)
+"""
+
+def bucket_start(ts, size):
+    seconds = (ts.hour * 3600 + ts.minute * 60 + ts.second) % size
+    return ts.replace(microsecond=0) - datetime.timedelta(seconds=seconds)
+
+def build_rollups(zone, events, start_counts, is_new=None):
+    # events: (pin, dept, device, ev_type, ts) urut waktu; start_counts: jumlah orang di dalam per dept sebelum event pertama.
+    # ins/outs hanya dihitung untuk event yang is_new, cur/peak selalu dari urutan lengkap supaya hasilnya idempoten
+    counts = dict(start_counts)
+    rows = {}
+    for pin, dept, device, ev_type, ts in events:
+        counted = is_new is None or is_new(zone, pin, ev_type, ts)
+        delta = 1 if ev_type == 'in' else -1
+        for key in (dept, TOTAL):
+            before = counts.get(key, 0)
+            after = counts[key] = before + delta
+            for size in BUCKET_SIZES:
+                row = rows.setdefault((size, bucket_start(ts, size), key), [0, 0, before, before])
+                if counted:
+                    row[0 if ev_type == 'in' else 1] += 1
+                row[2] = after
+                row[3] = max(row[3], after)
+    return [(zone, size, start, dept, *values) for (size, start, dept), values in rows.items()]
+
+def counts_before(tracker, events):
+    # Jumlah orang di dalam sekarang dikurangi perubahan dari batch = kondisi sebelum batch
+    counts = {TOTAL: 0}
+    for person in tracker.engine.persons.values():
+        if person.inside:
+            counts[person.dept] = counts.get(person.dept, 0) + 1
+            counts[TOTAL] += 1
+    for pin, dept, device, ev_type, ts in events:
+        delta = 1 if ev_type == 'in' else -1
+        counts[dept] = counts.get(dept, 0) - delta
+        counts[TOTAL] -= delta
+    return counts
+
+async def store_rollups(conn, zone, events, start_counts, inserted):
+    rows = build_rollups(zone, events, start_counts, lambda *key: key in inserted)
+    if rows:
+        await conn.executemany(UPSERT_SQL, rows)
+    return len(rows)
+
+async def backfill_rollups(zone, day):
+    # Hitung ulang rollup satu hari penuh dari tabel zone_event
+    start = datetime.datetime.combine(day, datetime.time.min)
+    end = start + datetime.timedelta(days=1)
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            events = await conn.fetch(
+                "SELECT pin, dept, device, ev_type, ts FROM zone_event "
+                "WHERE zone = $1 AND ts >= $2 AND ts < $3 ORDER BY ts, id",
+                zone, start, end,
+            )
+            rows = build_rollups(zone, [tuple(e) for e in events], {})
+            await conn.execute(
+                "DELETE FROM occupancy_rollup WHERE zone = $1 AND bucket_start >= $2 AND bucket_start < $3",
+                zone, start, end,
+            )
+            if rows:
+                await conn.executemany(UPSERT_SQL, rows)
+    return len(rows)
+
+# === Query untuk grafik (Flask) ===
+ROLLUP_SQL = text("""
+    SELECT bucket_start, ins, outs, cur, peak
+    FROM occupancy_rollup
+    WHERE zone = :zone AND bucket_sec = :size AND dept = :dept
+      AND bucket_start >= :start AND bucket_start < :end
+    ORDER BY bucket_start
+""")
+
+def get_rollups(zone, size, start, end, dept=TOTAL):
+    with get_session() as session:
+        rows = session.execute(ROLLUP_SQL, {"zone": zone, "size": size, "dept": dept, "start": start, "end": end})
+        return [
+            {"time": r.bucket_start.isoformat(), "in": r.ins, "out": r.outs, "cur": r.cur, "peak": r.peak}
+            for r in rows
+        ]
+
+if __name__ == "__main__":
+    # python -m lib.rollups <zona> <YYYY-MM-DD>
+    if len(sys.argv) != 3:
+        print("Pemakaian: python -m lib.rollups <zona> <YYYY-MM-DD>")
+        sys.exit(1)
+
+    async def main(zone, day):
+        try:
+            count = await backfill_rollups(zone, day)
+            print(f"[Rollup] {zone} {day}: {count} baris")
+        finally:
+            await close_pool()
+
+    asyncio.run(main(sys.argv[1], datetime.date.fromisoformat(sys.argv[2])))
@@ -0,0 +1,72 @@
+import os, math
+
+# Interval yang boleh dipakai; semuanya membagi 1 jam habis, jadi siklus jatuh di detik/menit yang rapi (:00, :15, :30, ...)
+TICKS = (1, 2, 5, 10, 15, 20, 30, 60, 120, 300, 600)
+
+SCHEDULE_ADAPTIVE = os.getenv("SCHEDULE_ADAPTIVE", "1") == "1"
+SCHEDULE_MIN_SEC = int(os.getenv("SCHEDULE_MIN_SEC", "5"))
+SCHEDULE_MAX_SEC = int(os.getenv("SCHEDULE_MAX_SEC", "120"))
+# Target jumlah perpindahan masuk/keluar per siklus; makin ramai gate, makin pendek interval
+SCHEDULE_TARGET_EVENTS = float(os.getenv("SCHEDULE_TARGET_EVENTS", "20"))
+# Bobot siklus terbaru di rata-rata event/detik (EWMA)
+SCHEDULE_RATE_ALPHA = 0.5
+
+def next_tick(t, interval):
+    # Tick berikutnya (kelipatan interval dari epoch) yang lebih besar dari t
+    return (math.floor(t / interval) + 1) * interval
+
+
+class AdaptiveSchedule:
+    # Jadwal satu zona: interval turun saat ramai, naik pelan-pelan (satu tingkat per siklus) saat sepi
+    def __init__(self, base_sec, min_sec=SCHEDULE_MIN_SEC, max_sec=SCHEDULE_MAX_SEC,
+                 target_events=SCHEDULE_TARGET_EVENTS, adaptive=SCHEDULE_ADAPTIVE):
+        base = self.snap(base_sec, TICKS)
+        if adaptive:
+            self.ticks = tuple(t for t in TICKS if min_sec <= t <= max_sec) or (base,)
+        else:
+            self.ticks = (base,)
+        self.target_events = target_events
+        self.interval = self.snap(base, self.ticks)
+        self.rate = None          # perpindahan per detik (EWMA)
+        self.observed_at = None
+        self.due_at = 0.0         # siklus pertama langsung jalan
+
+    @staticmethod
+    def snap(seconds, ticks):
+        # Tick terbesar yang <= seconds (minimal tick terkecil)
+        candidates = [t for t in ticks if t <= seconds]
+        return candidates[-1] if candidates else ticks[0]
+
+    def target_interval(self):
+        if self.rate is None:
+            return self.interval  # belum ada data (siklus pertama)
+        if not self.rate:
+            return self.ticks[-1]
+        return self.snap(self.target_events / self.rate, self.ticks)
+
+    def observe(self, count, now):
+        # Dipanggil setiap fetch (zona ini jatuh tempo atau tidak) dengan jumlah perpindahan baru
+        if self.observed_at is not None and now > self.observed_at:
+            rate = count / (now - self.observed_at)
+            self.rate = rate if self.rate is None else SCHEDULE_RATE_ALPHA * rate + (1 - SCHEDULE_RATE_ALPHA) * self.rate
+        self.observed_at = now
+
+        # Burst: langsung percepat, tidak perlu menunggu jadwal lama
+        target = self.target_interval()
+        if target < self.interval:
+            self.interval = target
+            self.due_at = min(self.due_at, next_tick(now, target))
+
+    def is_due(self, now):
+        return now >= self.due_at
+
+    def advance(self, started, finished):
+        # Setelah siklus selesai: hitung lag dan tick yang terlewat, lalu jadwal berikutnya (tidak pernah tumpang tindih)
+        lag = max(0.0, started - self.due_at) if self.due_at else 0.0
+        target = self.target_interval()
+        if target > self.interval:
+            target = self.ticks[min(self.ticks.index(self.interval) + 1, len(self.ticks) - 1)]
+        self.interval = target
+        skipped = max(0, math.floor((finished - self.due_at) / self.interval)) if self.due_at else 0
+        self.due_at = next_tick(finished, self.interval)
+        return lag, skipped
@@ -0,0 +1,285 @@
+import os, time, asyncio, datetime, threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from models.models import ZoneSnapshot, get_session, utc_now
+from lib import jsonfast, metrics, snapshot_store
+from lib.db_pool import get_pool
+
+# Berapa detik sekali cek updated_at di database (kalau worker jalan di proses lain)
+SNAPSHOT_RECHECK_SEC = float(os.getenv("SNAPSHOT_RECHECK_SEC", "5"))
+# Jumlah versi lama yang disimpan per zona untuk menghitung delta (?since=<version>)
+SNAPSHOT_HISTORY = int(os.getenv("SNAPSHOT_HISTORY", "20"))
+# Snapshot lebih tua dari ini ditandai stale (worker/API bermasalah), layar menampilkan peringatan
+SNAPSHOT_STALE_SEC = int(os.getenv("SNAPSHOT_STALE_SEC", "300"))
+
+# === Server-Sent Events (/api/stream/<zona>) ===
+SSE_KEEPALIVE_SEC = int(os.getenv("SSE_KEEPALIVE_SEC", "15"))
+SSE_MAX_SEC = int(os.getenv("SSE_MAX_SEC", "300"))
+SSE_RETRY = b"retry: 5000\n\n"
+
+class Snapshot:
+    __slots__ = ("zone", "data", "updated_at", "version", "etag", "_views", "_indexes")
+
+    def __init__(self, zone, data, updated_at):
+        self.zone = zone
+        self.data = data
+        self.updated_at = updated_at
+        self.version = int(updated_at.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000000)
+        self.etag = f"{zone}-{self.version}"
+        self._views = {}
+        self._indexes = {}
+
+    def view(self, fields):
+        # JSON siap kirim per projection (?fields=), di-encode sekali per versi
+        body = self._views.get(fields)
+        if body is None:
+            body = self._views[fields] = jsonfast.dumps(snapshot_store.project(self.data, fields))
+        return body
+
+    def view_etag(self, fields):
+        if fields is None:
+            return self.etag
+        return f"{self.etag}-{'.'.join(fields) or snapshot_store.COUNTS_VIEW}"
+
+    def index(self, fields=None):
+        # Dibuat sekali per versi dan projection, hanya kalau ada client yang minta delta
+        index = self._indexes.get(fields)
+        if index is None:
+            data = snapshot_store.project(self.data, fields)
+            depts, people = {}, {}
+            for dept in data.get("data", []):
+                depts[dept["dept"]] = {k: dept[k] for k in snapshot_store.COUNTER_FIELDS}
+                for person in dept.get("person", {}).get("data", []):
+                    people[person["id"]] = dict(person, dept=dept["dept"])
+            totals = {k: data.get(k) for k in snapshot_store.TOTAL_FIELDS}
+            index = self._indexes[fields] = (totals, depts, people)
+        return index
+
+
+def freshness(snapshot):
+    # Umur snapshot dihitung di server, jadi jam layar yang tidak sinkron tidak berpengaruh
+    age = max(0, int((utc_now() - snapshot.updated_at).total_seconds()))
+    return {"age": age, "stale": age > SNAPSHOT_STALE_SEC}
+
+def freshness_headers(snapshot):
+    status = freshness(snapshot)
+    return {"X-Snapshot-Age": str(status["age"]), "X-Snapshot-Stale": "1" if status["stale"] else "0"}
+
+def full_body(snapshot, fields=None):
+    # Snapshot penuh untuk ?since= yang tidak dikenal; JSON view disisipkan apa adanya tanpa encode ulang
+    status = freshness(snapshot)
+    return b'{"full": true, "version": %d, "age": %d, "stale": %s, "snapshot": %s}' % (
+        snapshot.version, status["age"], b"true" if status["stale"] else b"false", snapshot.view(fields))
+
+def build_delta(old, new, fields=None):
+    old_totals, old_depts, old_people = old.index(fields)
+    totals, depts, people = new.index(fields)
+
+    delta = dict(totals, version=new.version, since=old.version, full=False, **freshness(new))
+    delta["depts"] = [d for name, d in depts.items() if old_depts.get(name) != d]
+    delta["removed_depts"] = [name for name in old_depts if name not in depts]
+    delta["added"] = [p for pin, p in people.items() if pin not in old_people]
+    delta["changed"] = [p for pin, p in people.items() if pin in old_people and old_people[pin] != p]
+    delta["removed"] = [
+        {"id": pin, "dept": p["dept"]} for pin, p in old_people.items()
+        if pin not in people or people[pin]["dept"] != p["dept"]
+    ]
+    return delta
+
+
+class SnapshotCache:
+    # Snapshot terakhir per zona, disimpan dalam bentuk JSON siap kirim
+    def __init__(self, recheck_sec=SNAPSHOT_RECHECK_SEC):
+        self.recheck_sec = recheck_sec
+        self.snapshots = {}
+        self.checked_at = {}
+        self.history = {}
+        self.lock = threading.Lock()
+        self.updated = threading.Condition(self.lock)
+        self.listeners = []  # callback(zone) setiap publish, mis. untuk membangunkan stream di server async
+        self.reloads = {}    # (loop, zone) -> task reload yang sedang jalan, dipakai bersama semua request
+        self.reload_locks = {}  # zone -> lock reload dari thread web (bukan self.lock, supaya publish tidak ikut menunggu)
+
+    def publish(self, zone, data, updated_at):
+        snapshot = Snapshot(zone, data, updated_at)
+        with self.lock:
+            current = self.snapshots.get(zone)
+            if current is None or snapshot.version > current.version:
+                self._store(zone, snapshot)
+            self.checked_at[zone] = time.monotonic()
+            self.updated.notify_all()
+        for listener in list(self.listeners):
+            listener(zone)
+        return snapshot
+
+    def _store(self, zone, snapshot):
+        self.snapshots[zone] = snapshot
+        self.history.setdefault(zone, deque(maxlen=SNAPSHOT_HISTORY)).append(snapshot)
+
+    def find(self, zone, version):
+        with self.lock:
+            for snapshot in self.history.get(zone, ()):
+                if snapshot.version == version:
+                    return snapshot
+        return None
+
+    def fresh(self, zone):
+        # (masih berlaku?, snapshot sekarang); dipanggil dengan self.lock dipegang
+        current = self.snapshots.get(zone)
+        return time.monotonic() - self.checked_at.get(zone, float("-inf")) < self.recheck_sec, current
+
+    def _store_loaded(self, zone, loaded):
+        # Hasil query dibandingkan lagi dengan versi terbaru: publish bisa terjadi selama query berjalan
+        with self.lock:
+            current = self.snapshots.get(zone)
+            if loaded is not None and (current is None or loaded.version > current.version):
+                self._store(zone, loaded)
+            self.checked_at[zone] = time.monotonic()
+            return self.snapshots.get(zone)
+
+    def get(self, zone):
+        with self.lock:
+            is_fresh, current = self.fresh(zone)
+            if is_fresh:
+                return current
+            reload_lock = self.reload_locks.setdefault(zone, threading.Lock())
+
+        # Query database tanpa self.lock; thread lain yang juga butuh reload menunggu hasil thread pertama
+        with reload_lock:
+            with self.lock:
+                is_fresh, current = self.fresh(zone)
+                if is_fresh:
+                    return current
+
+            # Cek ringan: ambil updated_at saja, blob hanya dibaca kalau memang berubah
+            loaded = None
+            with get_session() as session:
+                updated_at = session.query(ZoneSnapshot.updated_at).filter(ZoneSnapshot.zone == zone).scalar()
+                if updated_at is not None and (current is None or updated_at != current.updated_at):
+                    row = snapshot_store.load_sync(session, zone)
+                    if row is not None:
+                        loaded = Snapshot(zone, *row)
+            return self._store_loaded(zone, loaded)
+
+    async def get_async(self, zone):
+        # Sama dengan get(), tapi cek ke database lewat asyncpg supaya tidak memblok event loop.
+        # Ratusan stream yang bangun bersamaan cukup memicu satu query per zona
+        with self.lock:
+            is_fresh, current = self.fresh(zone)
+            if is_fresh:
+                return current
+
+        key = (asyncio.get_running_loop(), zone)
+        task = self.reloads.get(key)
+        if task is None:
+            task = self.reloads[key] = asyncio.ensure_future(self._reload_async(zone, current))
+            task.add_done_callback(lambda _: self.reloads.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _reload_async(self, zone, current):
+        loaded = None
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            updated_at = await conn.fetchval("SELECT updated_at FROM zone_snapshot WHERE zone = $1", zone)
+            if updated_at is not None and (current is None or updated_at != current.updated_at):
+                row = await snapshot_store.load_async(conn, zone)
+                if row is not None:
+                    loaded = Snapshot(zone, *row)
+        return self._store_loaded(zone, loaded)
+
+    def wait_for_update(self, zone, version, timeout):
+        # Tunggu sampai ada snapshot dengan versi lain dari `version`, None kalau timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self.get(zone)
+            if snapshot is not None and snapshot.version != version:
+                return snapshot
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with self.updated:
+                self.updated.wait(min(remaining, self.recheck_sec))
+
+snapshot_cache = SnapshotCache()
+
+def snapshot_ages():
+    now = utc_now()
+    with snapshot_cache.lock:
+        return {(zone,): (now - s.updated_at).total_seconds() for zone, s in snapshot_cache.snapshots.items()}
+
+metrics.gauge("counting_snapshot_age_seconds", "Umur snapshot zona terakhir yang dilihat proses ini", ("zone",),
+              collect=snapshot_ages)
+
+
+# === Respons zona (dipakai server waitress dan aiohttp; server hanya mengurus I/O) ===
+JSON_HEADERS = {"Content-Type": "application/json", "Cache-Control": "no-cache"}
+
+def json_parts(data, status=200):
+    return status, dict(JSON_HEADERS), jsonfast.dumps(data)
+
+def not_modified_since(snapshot, if_modified_since):
+    # If-Modified-Since hanya presisi detik; tanggal rusak diabaikan (200 biasa)
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return snapshot.updated_at.replace(microsecond=0) <= since
+
+def zone_parts(snapshot, since=None, fields=None, if_none_match="", if_modified_since=""):
+    # (status, headers, body) untuk /api/data dan /api/merah; since/fields mentah dari query string
+    try:
+        fields = snapshot_store.parse_fields(fields)
+    except ValueError as e:
+        return json_parts({"error": str(e)}, status=400)
+    if snapshot is None:
+        return json_parts({"offline": True})
+
+    headers = dict(JSON_HEADERS, **freshness_headers(snapshot))
+    if since is not None and since.lstrip("-").isdigit():
+        # Hanya orang yang masuk/keluar/berubah sejak versi `since`; versi tidak dikenal -> snapshot penuh
+        old = snapshot_cache.find(snapshot.zone, int(since))
+        if old is None:
+            return 200, headers, full_body(snapshot, fields)
+        return 200, headers, jsonfast.dumps(build_delta(old, snapshot, fields))
+
+    etag = f'"{snapshot.view_etag(fields)}"'
+    headers["ETag"] = etag
+    headers["Last-Modified"] = snapshot.updated_at.replace(tzinfo=datetime.timezone.utc).strftime("%a, %d %b %Y %H:%M:%S GMT")
+    if if_none_match:
+        # If-None-Match lebih diutamakan; If-Modified-Since hanya dipakai kalau tidak ada ETag dari client
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        not_modified = etag in tags or "*" in tags
+    else:
+        not_modified = bool(if_modified_since) and not_modified_since(snapshot, if_modified_since)
+    if not_modified:
+        del headers["Content-Type"]
+        return 304, headers, b""
+    return 200, headers, snapshot.view(fields)
+
+
+class ZoneStream:
+    # Urutan event SSE untuk satu client; server cukup menunggu update lalu menulis bytes hasilnya
+    headers = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    def __init__(self, zone, fields, last_event_id=""):
+        self.zone = zone
+        self.fields = fields
+        self.version = int(last_event_id) if last_event_id.isdigit() else None
+
+    def update(self, snapshot):
+        # Snapshot versi baru: delta kalau versi client masih di history, selain itu snapshot penuh + umur data
+        old = snapshot_cache.find(self.zone, self.version) if self.version is not None else None
+        self.version = snapshot.version
+        if old is None:
+            return (b"id: %d\nevent: snapshot\ndata: %s\n\n" % (self.version, snapshot.view(self.fields))
+                    + self.status(snapshot))
+        delta = jsonfast.dumps(build_delta(old, snapshot, self.fields))
+        return b"id: %d\nevent: delta\ndata: %s\n\n" % (self.version, delta)
+
+    def status(self, snapshot):
+        # Keepalive sekaligus umur data, supaya layar tahu kalau worker/API berhenti update
+        if snapshot is None:
+            return b": keepalive\n\n"
+        return b"event: status\ndata: %s\n\n" % jsonfast.dumps(freshness(snapshot))
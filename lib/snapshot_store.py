@@ -0,0 +1,183 @@
+import os, zlib, datetime, threading
+from lib import jsonfast
+from models.models import ZoneSnapshot, PersonProfile
+
+# === Penyimpanan snapshot zona (tabel zone_snapshot + person_profile) ===
+# Snapshot disimpan per kolom (dept, pin, waktu) lalu dikompres zlib. Atribut orang yang jarang berubah
+# (nama, email, telepon, ...) disimpan terpisah di person_profile dan hanya ditulis ulang kalau berubah
+SNAPSHOT_COMPRESS_LEVEL = int(os.getenv("SNAPSHOT_COMPRESS_LEVEL", "6"))
+FORMAT_VERSION = 1
+
+TOTAL_FIELDS = ("offline", "totalin", "totalout", "totalcur")
+COUNTER_FIELDS = ("dept", "in", "out", "cur")
+PERSON_FIELDS = ("name", "time", "gender", "email", "phone", "plat", "birthday", "nipeg")
+COUNTS_VIEW = "counts"  # ?fields=counts -> hanya angka per dept, tanpa daftar orang
+
+UPSERT_SNAPSHOT_SQL = """
+    INSERT INTO zone_snapshot (zone, payload, updated_at) VALUES ($1, $2, $3)
+    ON CONFLICT (zone) DO UPDATE SET payload = EXCLUDED.payload, updated_at = EXCLUDED.updated_at
+"""
+UPSERT_PROFILE_SQL = """
+    INSERT INTO person_profile (pin, data, updated_at) VALUES ($1, $2, $3)
+    ON CONFLICT (pin) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+    WHERE person_profile.data IS DISTINCT FROM EXCLUDED.data
+"""
+SNAPSHOT_SQL = "SELECT payload, updated_at FROM zone_snapshot WHERE zone = $1"
+PROFILE_CHANGED_SQL = "SELECT pin, data, updated_at FROM person_profile WHERE updated_at > $1"
+PROFILE_PINS_SQL = "SELECT pin, data, updated_at FROM person_profile WHERE pin = ANY($1::varchar[])"
+
+# === Encode / decode ===
+def encode(summary):
+    # Hasil: payload terkompres + profil per pin ({"name": ..., atribut lain})
+    depts = summary.get("data", [])
+    columns = {
+        "v": FORMAT_VERSION,
+        "totals": [summary.get(k, 0) for k in TOTAL_FIELDS],
+        "dept": [d["dept"] for d in depts],
+        "in": [d["in"] for d in depts],
+        "out": [d["out"] for d in depts],
+        "cur": [d["cur"] for d in depts],
+        "pin": [],
+        "pin_dept": [],
+        "pin_time": [],
+    }
+    profiles = {}
+    for i, dept in enumerate(depts):
+        for person in dept.get("person", {}).get("data", []):
+            columns["pin"].append(person["id"])
+            columns["pin_dept"].append(i)
+            columns["pin_time"].append(person.get("time", ""))
+            profiles[person["id"]] = {k: v for k, v in person.items() if k not in ("id", "time")}
+    return zlib.compress(jsonfast.dumps(columns), SNAPSHOT_COMPRESS_LEVEL), profiles
+
+def decode(payload):
+    columns = jsonfast.loads(zlib.decompress(payload))
+    if columns.get("v") != FORMAT_VERSION:
+        raise ValueError(f"Format snapshot tidak dikenal: {columns.get('v')}")
+    return columns
+
+def build_summary(columns, profiles):
+    # Kebalikan encode(): JSON summary sama persis dengan yang dibuat worker
+    depts = [
+        {"dept": name, "in": ins, "out": outs, "cur": cur, "person": {"data": []}}
+        for name, ins, outs, cur in zip(columns["dept"], columns["in"], columns["out"], columns["cur"])
+    ]
+    for pin, dept_index, time_str in zip(columns["pin"], columns["pin_dept"], columns["pin_time"]):
+        profile = profiles.get(pin)
+        if profile is None:
+            continue  # sama seperti worker: orang tanpa detail tidak ditampilkan
+        person = {"name": profile.get("name", ""), "id": pin, "time": time_str}
+        person.update((k, v) for k, v in profile.items() if k != "name")
+        depts[dept_index]["person"]["data"].append(person)
+
+    summary = dict(zip(TOTAL_FIELDS, columns["totals"]))
+    summary["data"] = depts
+    return summary
+
+# === Projected view (?fields=) ===
+def parse_fields(value):
+    # None = semua field, () = counts saja, selain itu atribut orang yang diminta (id dan dept selalu ada)
+    if value is None:
+        return None
+    if value == COUNTS_VIEW:
+        return ()
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(",") if f.strip() and f.strip() != "id"))
+    unknown = [f for f in fields if f not in PERSON_FIELDS]
+    if unknown:
+        raise ValueError(f"fields tidak dikenal: {', '.join(unknown)} (pilihan: {COUNTS_VIEW}, {', '.join(PERSON_FIELDS)})")
+    return fields
+
+def project(summary, fields):
+    if fields is None:
+        return summary
+    result = {k: summary.get(k) for k in TOTAL_FIELDS}
+    result["data"] = []
+    for dept in summary.get("data", []):
+        item = {k: dept[k] for k in COUNTER_FIELDS}
+        if fields:
+            item["person"] = {"data": [
+                {"id": p["id"], **{f: p.get(f, "") for f in fields}} for p in dept.get("person", {}).get("data", [])
+            ]}
+        result["data"].append(item)
+    return result
+
+
+class ProfileWriter:
+    # Di worker: profil yang terakhir ditulis, supaya tiap siklus hanya orang baru/berubah yang di-upsert
+    def __init__(self):
+        self.written = {}
+
+    def pending(self, profiles):
+        encoded = {pin: jsonfast.dumps(profile).decode("utf-8") for pin, profile in profiles.items()}
+        return {pin: data for pin, data in encoded.items() if self.written.get(pin) != data}
+
+    def commit(self, pending):
+        self.written.update(pending)
+
+
+class ProfileCache:
+    # Di proses web: profil yang sudah dibaca. Yang berubah diambil incremental lewat updated_at,
+    # pin yang belum pernah dilihat diambil langsung
+    SYNC_MARGIN = datetime.timedelta(seconds=300)  # transaksi zona lain bisa commit sedikit terlambat
+
+    def __init__(self):
+        self.profiles = {}
+        self.synced_to = None
+        self.lock = threading.Lock()
+
+    def sync_from(self):
+        return self.synced_to - self.SYNC_MARGIN if self.synced_to is not None else None
+
+    def store(self, rows):
+        with self.lock:
+            for pin, data, updated_at in rows:
+                self.profiles[pin] = jsonfast.loads(data)
+
+    def missing(self, pins):
+        return [pin for pin in dict.fromkeys(pins) if pin not in self.profiles]
+
+    def seen(self, updated_at):
+        with self.lock:
+            if self.synced_to is None or updated_at > self.synced_to:
+                self.synced_to = updated_at
+
+profile_writer = ProfileWriter()
+profile_cache = ProfileCache()
+
+# === Database ===
+async def save(conn, zone, payload, profiles, updated_at):
+    # Dipanggil di dalam transaksi; hasilnya profil yang ditulis (commit ke profile_writer setelah transaksi selesai)
+    pending = profile_writer.pending(profiles)
+    if pending:
+        await conn.executemany(UPSERT_PROFILE_SQL, [(pin, data, updated_at) for pin, data in pending.items()])
+    await conn.execute(UPSERT_SNAPSHOT_SQL, zone, payload, updated_at)
+    return pending
+
+async def load_async(conn, zone):
+    row = await conn.fetchrow(SNAPSHOT_SQL, zone)
+    if row is None:
+        return None
+    columns = decode(row["payload"])
+    since = profile_cache.sync_from()
+    if since is not None:
+        profile_cache.store(await conn.fetch(PROFILE_CHANGED_SQL, since))
+    missing = profile_cache.missing(columns["pin"])
+    if missing:
+        profile_cache.store(await conn.fetch(PROFILE_PINS_SQL, missing))
+    profile_cache.seen(row["updated_at"])
+    return build_summary(columns, profile_cache.profiles), row["updated_at"]
+
+def load_sync(session, zone):
+    record = session.get(ZoneSnapshot, zone)
+    if record is None:
+        return None
+    columns = decode(record.payload)
+    profile = session.query(PersonProfile.pin, PersonProfile.data, PersonProfile.updated_at)
+    since = profile_cache.sync_from()
+    if since is not None:
+        profile_cache.store(profile.filter(PersonProfile.updated_at > since).all())
+    missing = profile_cache.missing(columns["pin"])
+    if missing:
+        profile_cache.store(profile.filter(PersonProfile.pin.in_(missing)).all())
+    profile_cache.seen(record.updated_at)
+    return build_summary(columns, profile_cache.profiles), record.updated_at
@@ -0,0 +1,64 @@
+import time, logging, threading
+from lib import metrics
+
+log = logging.getLogger(__name__)
+
+CACHES = []
+
+def cache_ages():
+    now = time.monotonic()
+    return {(c.name,): now - c.loaded_at for c in CACHES if c.loaded_at is not None}
+
+metrics.gauge("counting_cache_age_seconds", "Umur data di cache stale-while-revalidate", ("cache",), collect=cache_ages)
+
+class StaleCache:
+    # Satu nilai hasil `loader()`; setelah ttl lewat nilai lama tetap dikirim sambil di-refresh di background
+    def __init__(self, name, loader, ttl):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.value = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+        CACHES.append(self)
+
+    def get(self):
+        if self.loaded_at is None:
+            with self.lock:
+                if self.loaded_at is None:
+                    self._store(self.loader())
+            return self.value
+
+        if time.monotonic() - self.loaded_at > self.ttl:
+            self.refresh_async()
+        return self.value
+
+    def refresh_async(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, name=f"refresh-{self.name}", daemon=True).start()
+
+    def invalidate(self):
+        self.loaded_at = None
+
+    def _refresh(self):
+        try:
+            value = self.loader()
+            with self.lock:
+                self._store(value)
+        except Exception as e:
+            if self.value is None:
+                # Belum ada data sama sekali: request berikutnya langsung mencoba load lagi
+                log.warning(f"[Cache] Refresh {self.name} gagal: {e}")
+                return
+            log.warning(f"[Cache] Refresh {self.name} gagal, pakai data lama: {e}")
+            self.loaded_at = time.monotonic()  # coba lagi setelah ttl berikutnya
+        finally:
+            self.refreshing = False
+
+    def _store(self, value):
+        self.value = value
+        self.loaded_at = time.monotonic()
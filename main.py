@@ -1,8 +1,6 @@
 import os
 import sys
 import time
-import json
-import base64
 import hashlib
 import logging
 import threading
@@ -12,14 +10,20 @@ import urllib3
 import webbrowser
 import socket
 
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash
-from werkzeug.utils import secure_filename
+from flask import Flask, Response, abort, g, jsonify, render_template, request, redirect, url_for, flash
+from flask.json.provider import DefaultJSONProvider
 from waitress import serve
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-from models.models import get_session, ZoneData, create_tables
+from models.models import create_tables
 from worker.tracker_worker import run_worker
-from blacklist.blacklist_tracker import BlacklistTracker
+from blacklist.blacklist_tracker import get_blacklist
+from lib.snapshot_cache import snapshot_cache, zone_parts, json_parts, ZoneStream, SSE_RETRY, SSE_KEEPALIVE_SEC, SSE_MAX_SEC
+from lib.stale_cache import StaleCache
+from lib.registration import RegistrationQueue, prepare_photo, PHOTO_MAX_BYTES
+from lib import history, rollups, jsonfast, metrics, circuit, snapshot_store
 
 # === Setup ===
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -35,13 +39,20 @@ log.info("Flask app dimulai...")
 # === Flask ===
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 app = Flask(__name__, template_folder="templates", static_folder="static")
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify/request.json lewat lib.jsonfast (orjson kalau ada)
+    def dumps(self, obj, **kwargs):
+        return jsonfast.dumps(obj, default=self.default, sort_keys=self.sort_keys).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return jsonfast.loads(s)
+
+app.json = FastJSONProvider(app)
 app.secret_key = os.getenv("SECRET_KEY", "supersecret")
 
 # === Upload ===
-UPLOAD_FOLDER = os.path.join(app.static_folder, "uploads")
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 
 # === Env Vars ===
 base_url = os.getenv("URL_DEPT")
@@ -50,38 +61,104 @@ access_token = os.getenv("ACCESS_TOKEN")
 title_hijau = os.getenv("TITLE_HIJAU", "MONITORING ZONA HIJAU")
 title_merah = os.getenv("TITLE_HIJAU", "MONITORING ZONA MERAH")
 
+# === Department API ===
+DEPT_MAX_ID = int(os.getenv("DEPT_MAX_ID", "29"))
+DEPT_CONCURRENCY = int(os.getenv("DEPT_CONCURRENCY", "8"))
+DEPT_TTL_SEC = int(os.getenv("DEPT_TTL_SEC", "600"))
+
+# Session HTTP bersama supaya koneksi ke API dipakai ulang
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=DEPT_CONCURRENCY))
+http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=DEPT_CONCURRENCY))
+
+registration_queue = RegistrationQueue(http, add_url, access_token)
+
+# === Server-Sent Events ===
+ZONE_NAMES = {"hijau", "merah"}
+WAITRESS_THREADS = int(os.getenv("WAITRESS_THREADS", "32"))
+# waitress = semua route di thread waitress, aiohttp = route polling/SSE async, halaman lain tetap lewat Flask
+APP_SERVER = os.getenv("APP_SERVER", "waitress").lower()
+if APP_SERVER not in ("waitress", "aiohttp"):
+    raise RuntimeError(f"APP_SERVER tidak valid: {APP_SERVER}")
+# Tiap stream memegang satu thread waitress, sisakan thread untuk request biasa
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", str(WAITRESS_THREADS // 2)))
+sse_clients = threading.BoundedSemaphore(SSE_MAX_CLIENTS)
+
 # === Utilities ===
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_departments():
-    headers = {"Accept": "application/json"}
-    departments = {}
+def fetch_department(dept_id):
+    try:
+        url = f"{base_url}{dept_id}?access_token={access_token}"
+        resp = http.get(url, headers={"Accept": "application/json"}, verify=False, timeout=3)
+        data = jsonfast.loads(resp.content)
 
-    for i in range(1, 30):
-        try:
-            url = f"{base_url}{i}?access_token={access_token}"
-            resp = requests.get(url, headers=headers, verify=False, timeout=3)
-            data = resp.json()
+        if data.get("code") == 0 and "data" in data:
+            return data["data"]
+    except Exception as e:
+        log.warning(f"[Dept API] Error get dept {dept_id}: {e}")
+    return None
 
-            if data.get("code") == 0 and "data" in data:
-                dept = data["data"]
-                departments[dept["code"]] = dept["name"]
-        except Exception as e:
-            log.warning(f"[Dept API] Error get dept {i}: {e}")
-            continue
+dept_circuit = circuit.breaker("dept")
+
+def fetch_departments():
+    # Semua id diambil paralel, urutan hasil tetap mengikuti id. Saat circuit open tidak ada request sama sekali
+    dept_circuit.check()
+    with ThreadPoolExecutor(max_workers=DEPT_CONCURRENCY) as pool:
+        results = list(pool.map(fetch_department, range(1, DEPT_MAX_ID + 1)))
 
-    return departments if departments else None
+    departments = {dept["code"]: dept["name"] for dept in results if dept}
+    if not departments:
+        dept_circuit.failure()
+        raise RuntimeError("Dept API tidak mengembalikan data")
+    dept_circuit.success()
+    return departments
 
-def get_zone_data(zone: str):
+department_cache = StaleCache("departments", fetch_departments, DEPT_TTL_SEC)
+
+def get_departments():
     try:
-        session = get_session()
-        record = session.query(ZoneData).filter(ZoneData.zone == zone).first()
-        session.close()
-        return json.loads(record.data) if record else {"offline": True}
+        return department_cache.get()
+    except Exception as e:
+        log.warning(f"[Dept API] {e}")
+        return None
+
+def parts_response(status, headers, body):
+    return app.response_class(body, status=status, headers=headers)
+
+def zone_response(zone: str):
+    # JSON snapshot dikirim apa adanya dari cache, dengan ETag/Last-Modified untuk 304.
+    # ?since=<version> untuk delta, ?fields=counts (angka saja) atau ?fields=name,time,... untuk membatasi atribut orang
+    try:
+        snapshot = snapshot_cache.get(zone)
     except Exception as e:
         log.error(f"[ZoneData] Gagal load zone {zone}: {e}")
-        return {"offline": True, "error": str(e)}
+        return parts_response(*json_parts({"offline": True, "error": str(e)}))
+    return parts_response(*zone_parts(
+        snapshot, request.args.get("since"), request.args.get("fields"),
+        request.headers.get("If-None-Match", ""), request.headers.get("If-Modified-Since", ""),
+    ))
+
+# === Metrics ===
+REQUEST_SECONDS = metrics.histogram("counting_http_request_seconds", "Latency request Flask per route", ("route", "method", "status"))
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    # Untuk SSE yang terukur hanya waktu sampai header dikirim
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 # === Routes ===
 @app.route("/")
@@ -94,15 +171,90 @@ def zona_merah():
 
 @app.route("/api/data")
 def api_data():
-    return jsonify(get_zone_data("hijau"))
+    return zone_response("hijau")
 
 @app.route("/api/merah")
 def api_merah():
-    return jsonify(get_zone_data("merah"))
+    return zone_response("merah")
+
+@app.route("/api/stream/<zone>")
+def api_stream(zone):
+    if zone not in ZONE_NAMES:
+        abort(404)
+    try:
+        fields = snapshot_store.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return parts_response(*json_parts({"error": str(e)}, status=400))
+    if not sse_clients.acquire(blocking=False):
+        # Client akan fallback ke polling biasa
+        return parts_response(*json_parts({"error": "Terlalu banyak stream aktif"}, status=503))
+
+    zone_stream = ZoneStream(zone, fields, request.headers.get("Last-Event-ID", ""))
+
+    def stream():
+        try:
+            started = time.monotonic()
+            yield SSE_RETRY
+            while time.monotonic() - started < SSE_MAX_SEC:
+                snapshot = snapshot_cache.wait_for_update(zone, zone_stream.version, SSE_KEEPALIVE_SEC)
+                if snapshot is None:
+                    yield zone_stream.status(snapshot_cache.get(zone))
+                else:
+                    yield zone_stream.update(snapshot)
+        except Exception as e:
+            log.error(f"[SSE] Stream {zone} berhenti: {e}")
+
+    response = Response(stream(), headers=ZoneStream.headers)
+    response.call_on_close(sse_clients.release)
+    return response
+
+# === Riwayat & analitik ===
+@app.route("/api/history/<zone>/<report>")
+def api_history(zone, report):
+    if zone not in ZONE_NAMES or report not in ("occupancy", "hourly", "peaks"):
+        abort(404)
+    try:
+        start, end = history.parse_range(request.args.get("start"), request.args.get("end"))
+        if report == "occupancy":
+            bucket = request.args.get("bucket", 900, type=int)
+            if bucket <= 0:
+                raise ValueError("bucket harus lebih dari 0")
+            data = history.occupancy_over_time(zone, start, end, bucket)
+        elif report == "hourly":
+            data = history.hourly_counts(zone, start, end)
+        else:
+            data = history.dept_peaks(zone, start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log.error(f"[History] Gagal query {report} zona {zone}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"zone": zone, "start": start.isoformat(), "end": end.isoformat(), "data": data})
+
+@app.route("/api/rollup/<zone>")
+def api_rollup(zone):
+    # Data grafik dari tabel rollup (sudah teragregasi), ?size=60|900|3600&dept=
+    if zone not in ZONE_NAMES:
+        abort(404)
+    size = request.args.get("size", 900, type=int)
+    if size not in rollups.BUCKET_SIZES:
+        return jsonify({"error": f"size harus salah satu dari {list(rollups.BUCKET_SIZES)}"}), 400
+    dept = request.args.get("dept", rollups.TOTAL)
+    try:
+        start, end = history.parse_range(request.args.get("start"), request.args.get("end"))
+        data = rollups.get_rollups(zone, size, start, end, dept)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log.error(f"[Rollup] Gagal query zona {zone}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"zone": zone, "size": size, "dept": dept, "start": start.isoformat(), "end": end.isoformat(), "data": data})
 
 @app.route("/api/blacklist")
 def api_blacklist():
-    return jsonify(BlacklistTracker().run())
+    return jsonify(get_blacklist())
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
@@ -122,12 +274,12 @@ def register():
             flash("File tidak valid. Harus .jpg atau .png", "danger")
             return redirect(url_for("register"))
 
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        file.save(filepath)
-
-        with open(filepath, "rb") as f:
-            encoded_image = base64.b64encode(f.read()).decode("utf-8")
+        # Foto diproses langsung di memori, tidak disimpan ke static/uploads
+        try:
+            encoded_image = prepare_photo(file.read(PHOTO_MAX_BYTES + 1))
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("register"))
 
         pin = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
 
@@ -156,26 +308,26 @@ def register():
             "isSendMail": False
         }
 
-        try:
-            url = f"{add_url}?access_token={access_token}"
-            headers = {"Accept": "application/json", "Content-Type": "application/json"}
-            response = requests.post(url, headers=headers, json=payload, verify=False, timeout=10)
-            result = response.json()
-
-            if result.get("message") == "success":
-                flash("Registrasi berhasil!", "success")
-            else:
-                msg = result.get("message", "Unknown error")
-                flash(f"Gagal registrasi: {msg}", "danger")
-        except Exception as e:
-            flash("Gagal menghubungi API pendaftaran", "danger")
-            log.error(f"[Register] Error: {e}")
+        job_id = registration_queue.submit(payload)
+        flash("Registrasi sedang diproses", "info")
+        return redirect(url_for("register", job=job_id))
 
-        return redirect(url_for("register"))
+    return render_template("register.html", title="Registration - Indonesia Power", departments=departments, offline=False,
+                           job_id=request.args.get("job", ""))
 
-    return render_template("register.html", title="Registration - Indonesia Power", departments=departments, offline=False)
+@app.route("/register/status/<job_id>")
+def register_status(job_id):
+    status = registration_queue.status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
 
 # === Background Worker ===
+# embedded = worker jalan di thread proses web ini, external = worker dijalankan terpisah (python -m worker.tracker_worker)
+WORKER_MODE = os.getenv("WORKER_MODE", "embedded").lower()
+if WORKER_MODE not in ("embedded", "external"):
+    raise RuntimeError(f"WORKER_MODE tidak valid: {WORKER_MODE}")
+
 def start_worker_once():
     try:
         log.info("[Worker] Menjalankan tracker worker...")
@@ -211,12 +363,22 @@ def ensure_single_instance_and_open_browser():
 
 # === Entry Point ===
 if __name__ == "__main__":
-    ensure_single_instance_and_open_browser()
+    port = int(os.getenv("APP_PORT", 12345))
+    if WORKER_MODE == "embedded":
+        ensure_single_instance_and_open_browser()
 
     with open("app.pid", "w") as f:
         f.write(str(os.getpid()))
-    port = int(os.getenv("APP_PORT", 12345))
 
-    webbrowser.open_new_tab(f"http://localhost:{port}")
-    start_worker_once()
-    serve(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    department_cache.refresh_async()  # isi cache departemen sebelum ada yang buka /register
+    if WORKER_MODE == "embedded":
+        webbrowser.open_new_tab(f"http://localhost:{port}")
+        start_worker_once()
+    else:
+        # Web bisa dijalankan beberapa proses (port/mesin berbeda), data dibaca dari database
+        log.info("[Worker] Mode external: worker tidak dijalankan di proses web")
+    if APP_SERVER == "aiohttp":
+        from lib.async_server import run as run_async_server
+        run_async_server(app, host="0.0.0.0", port=port)
+    else:
+        serve(app, host="0.0.0.0", port=port, threads=WAITRESS_THREADS)
\ No newline at end of file
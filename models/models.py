@@ -1,8 +1,10 @@
 import os
 import datetime
-from sqlalchemy import Column, String, Text, DateTime, create_engine
+import threading
+from sqlalchemy import Column, String, Text, DateTime, BigInteger, Integer, LargeBinary, Index, UniqueConstraint, PrimaryKeyConstraint, create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 from dotenv import load_dotenv
+from lib import metrics
 
 # === Load .env dari root project ===
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
@@ -10,22 +12,103 @@ load_dotenv(dotenv_path)
 
 Base = declarative_base()
 
-class ZoneData(Base):
-    __tablename__ = 'zone_data'
+def utc_now():
+    # updated_at disimpan sebagai UTC naive (kolom DateTime tanpa zona waktu), pengganti datetime.utcnow()
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
 
-    zone = Column(String, primary_key=True)  # "hijau", "merah", dll
-    data = Column(Text, nullable=False)      # JSON hasil dump
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+class ZoneSnapshot(Base):
+    __tablename__ = 'zone_snapshot'
+
+    zone = Column(String, primary_key=True)         # "hijau", "merah", dll
+    payload = Column(LargeBinary, nullable=False)   # snapshot per kolom, zlib (lib/snapshot_store.py)
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class PersonProfile(Base):
+    __tablename__ = 'person_profile'
+
+    pin = Column(String, primary_key=True)
+    data = Column(Text, nullable=False)             # JSON nama + detail orang, hanya ditulis ulang kalau berubah
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+class TrackerState(Base):
+    __tablename__ = 'tracker_state'
+
+    zone = Column(String, primary_key=True)
+    day = Column(String, nullable=False)     # "YYYY-MM-DD", state hanya berlaku untuk hari ini
+    state = Column(Text, nullable=False)     # JSON snapshot cursor + status per orang
+    updated_at = Column(DateTime, default=utc_now, onupdate=utc_now)
+
+class ZoneEvent(Base):
+    __tablename__ = 'zone_event'
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    zone = Column(String, nullable=False)
+    pin = Column(String, nullable=False)
+    dept = Column(String, nullable=False)
+    device = Column(String, nullable=False)
+    ev_type = Column(String(3), nullable=False)  # "in" / "out"
+    ts = Column(DateTime, nullable=False)        # waktu lokal dari eventTime
+
+    __table_args__ = (
+        UniqueConstraint('zone', 'pin', 'ev_type', 'ts', name='uq_zone_event'),
+        Index('ix_zone_event_zone_ts', 'zone', 'ts'),
+    )
+
+class OccupancyRollup(Base):
+    __tablename__ = 'occupancy_rollup'
+
+    zone = Column(String, nullable=False)
+    bucket_sec = Column(Integer, nullable=False)      # 60 / 900 / 3600
+    bucket_start = Column(DateTime, nullable=False)
+    dept = Column(String, nullable=False)            # "" = total zona
+    ins = Column(Integer, nullable=False, default=0)
+    outs = Column(Integer, nullable=False, default=0)
+    cur = Column(Integer, nullable=False, default=0)  # jumlah di dalam di akhir bucket
+    peak = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('zone', 'bucket_sec', 'bucket_start', 'dept'),
+    )
+
+# === Engine & session factory dibuat sekali per proses ===
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
 
 def get_engine():
-    db_url = os.getenv("DATABASE_URL")
-    if not db_url:
-        raise RuntimeError("DATABASE_URL belum didefinisikan di .env")
-    return create_engine(db_url, echo=False, future=True)
+    global _engine, _session_factory
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            db_url = os.getenv("DATABASE_URL")
+            if not db_url:
+                raise RuntimeError("DATABASE_URL belum didefinisikan di .env")
+            _engine = create_engine(
+                db_url,
+                echo=False,
+                future=True,
+                pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                pool_pre_ping=True,
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE_SEC", "1800")),
+            )
+            _session_factory = sessionmaker(bind=_engine, autoflush=False, autocommit=False)
+    return _engine
+
+def engine_pool_usage():
+    if _engine is None:
+        return {}
+    pool = _engine.pool
+    return {("sqlalchemy", "used"): pool.checkedout(), ("sqlalchemy", "idle"): pool.checkedin(),
+            ("sqlalchemy", "overflow"): max(pool.overflow(), 0)}
+
+metrics.gauge("counting_db_pool_connections", "Koneksi pool database", ("pool", "state"), collect=engine_pool_usage)
 
 def get_session():
-    engine = get_engine()
-    return sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+    get_engine()
+    return _session_factory()
 
 def create_tables():
     engine = get_engine()
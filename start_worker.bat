@@ -0,0 +1,41 @@
+@echo off
+setlocal
+
+REM === Konfigurasi Path ===
+set PY_PATH=%LocalAppData%\Programs\Python\Python313
+set APP_DIR=C:\counting
+set SCRIPT_PATH=C:\counting\worker\tracker_worker.py
+set LOG_PATH=C:\counting\start_worker.log
+
+REM === Tulis log saat mulai ===
+echo [%date% %time%] Starting worker... >> "%LOG_PATH%"
+
+REM === Cek apakah Pythonw ada ===
+if not exist "%PY_PATH%\pythonw.exe" (
+    echo [%date% %time%] ERROR: pythonw.exe tidak ditemukan di %PY_PATH% >> "%LOG_PATH%"
+    echo Pythonw tidak ditemukan. Periksa PATH!
+    timeout /t 5 >nul
+    exit /b 1
+)
+
+REM === Cek apakah script ada ===
+if not exist "%SCRIPT_PATH%" (
+    echo [%date% %time%] ERROR: Script %SCRIPT_PATH% tidak ditemukan >> "%LOG_PATH%"
+    echo Script tidak ditemukan.
+    timeout /t 5 >nul
+    exit /b 1
+)
+
+REM === Jalankan secara silent ===
+REM Worker terpisah (WORKER_MODE=external di .env), dijalankan sebagai modul dari folder app
+start "" /D "%APP_DIR%" "%PY_PATH%\pythonw.exe" -m worker.tracker_worker
+if %errorlevel%==0 (
+    echo [%date% %time%] Worker started silently. >> "%LOG_PATH%"
+    echo Worker started successfully. Closing in 5 seconds...
+) else (
+    echo [%date% %time%] ERROR: Gagal menjalankan worker >> "%LOG_PATH%"
+    echo Gagal menjalankan worker.
+)
+
+timeout /t 5 >nul
+exit /b
\ No newline at end of file
@@ -1,50 +1,193 @@
+let pollTimer = null;
+let streamErrors = 0;
+let state = null;  // { version, data } snapshot terakhir yang sudah diterapkan
+
 $(document).ready(function () {
   setInterval(updateClock, 1000);
-  setInterval(getData, 10000);
   updateClock();
   getData();
+  startStream();
 });
 
+function zoneName() {
+  return document.body.dataset.zone === "merah" ? "merah" : "hijau"; // pastikan <body data-zone="merah"> misalnya
+}
+
+// Update langsung lewat Server-Sent Events, polling hanya sebagai cadangan
+function startStream() {
+  if (!window.EventSource) {
+    startPolling();
+    return;
+  }
+
+  // Layar hanya menampilkan angka per dept, jadi daftar orang tidak ikut diminta
+  const source = new EventSource(`/api/stream/${zoneName()}?fields=counts`);
+
+  source.addEventListener("snapshot", function (event) {
+    setSnapshot(Number(event.lastEventId), JSON.parse(event.data));
+  });
+
+  source.addEventListener("delta", function (event) {
+    applyPayload(JSON.parse(event.data));
+  });
+
+  source.addEventListener("status", function (event) {
+    showFreshness(JSON.parse(event.data));
+  });
+
+  source.onopen = function () {
+    streamErrors = 0;
+    stopPolling();
+  };
+
+  source.onerror = function () {
+    // Balasan non-200 (mis. 503 saat stream penuh) membuat EventSource berhenti total tanpa reconnect
+    const closed = source.readyState === EventSource.CLOSED;
+    if (!closed) {
+      streamErrors += 1;
+    }
+    if (closed || streamErrors >= 3) {
+      // Stream tidak bisa dipakai (server penuh / proxy), kembali ke polling lalu coba lagi nanti
+      source.close();
+      streamErrors = 0;
+      startPolling();
+      setTimeout(startStream, 60000);
+    }
+  };
+}
+
+function startPolling() {
+  if (!pollTimer) {
+    pollTimer = setInterval(getData, 10000);
+  }
+}
+
+function stopPolling() {
+  if (pollTimer) {
+    clearInterval(pollTimer);
+    pollTimer = null;
+  }
+}
+
 function getData() {
-  const zone = document.body.dataset.zone; // pastikan <body data-zone="merah"> misalnya
-  const endpoint = zone === "merah" ? "/api/merah" : "/api/data";
-
-  $.get(endpoint, function (response) {
-    if (response.offline) {
-      $("#offline-alert").show();  // Tampilkan alert
-      $("#totalin").text("-");
-      $("#totalout").text("-");
-      $("#totalcur").text("-");
-      $("#dept-table").html(`<tr><td colspan="4" class="text-center text-danger">Data tidak tersedia</td></tr>`);
+  const endpoint = zoneName() === "merah" ? "/api/merah" : "/api/data";
+
+  // Minta perubahan saja sejak versi terakhir; versi 0 selalu mendapat snapshot penuh
+  $.get(endpoint, { since: state ? state.version : 0, fields: "counts" }, applyPayload).fail(function () {
+    // Jika AJAX gagal (misalnya koneksi putus), juga tampilkan alert
+    showOffline("Tidak dapat terhubung ke server");
+  });
+}
+
+function showOffline(message) {
+  $("#offline-alert").show();  // Tampilkan alert
+  $("#stale-alert").hide();
+  $("#totalin").text("-");
+  $("#totalout").text("-");
+  $("#totalcur").text("-");
+  $("#dept-table").html(`<tr><td colspan="4" class="text-center text-danger">${message}</td></tr>`);
+}
+
+// Data lama tetap ditampilkan, hanya diberi peringatan kalau sudah terlalu lama tidak diperbarui
+function showFreshness(status) {
+  if (!status.stale) {
+    $("#stale-alert").hide();
+    return;
+  }
+  const minutes = Math.floor(status.age / 60);
+  const age = minutes > 0 ? `${minutes} menit` : `${status.age} detik`;
+  $("#stale-alert").text(`⚠️ Data terakhir diperbarui ${age} yang lalu. Koneksi ke server absensi sedang terganggu.`).show();
+}
+
+function applyPayload(payload) {
+  if ("age" in payload) {
+    showFreshness(payload);
+  }
+  if (payload.offline) {
+    state = null;
+    renderData(payload);
+  } else if (payload.full) {
+    setSnapshot(payload.version, payload.snapshot);
+  } else if (!state || state.version !== payload.since) {
+    // Delta tidak cocok dengan data yang ada, ambil ulang snapshot penuh
+    state = null;
+    getData();
+  } else {
+    applyDelta(payload);
+  }
+}
+
+function setSnapshot(version, data) {
+  state = { version: version, data: data };
+  renderData(data);
+}
+
+function applyDelta(delta) {
+  const depts = new Map(state.data.data.map(dept => [dept.dept, dept]));
+
+  delta.removed_depts.forEach(name => depts.delete(name));
+  delta.depts.forEach(counter => {
+    const dept = depts.get(counter.dept);
+    if (dept) {
+      Object.assign(dept, counter);
+    } else {
+      depts.set(counter.dept, Object.assign({ person: { data: [] } }, counter));
+    }
+  });
+
+  delta.removed.forEach(person => {
+    const dept = depts.get(person.dept);
+    if (dept) {
+      dept.person.data = dept.person.data.filter(p => p.id !== person.id);
+    }
+  });
+  delta.added.concat(delta.changed).forEach(person => {
+    const dept = depts.get(person.dept);
+    if (!dept) {
       return;
     }
+    const entry = Object.assign({}, person);
+    delete entry.dept;
+    const index = dept.person.data.findIndex(p => p.id === person.id);
+    if (index >= 0) {
+      dept.person.data[index] = entry;
+    } else {
+      dept.person.data.push(entry);
+    }
+  });
 
-    $("#offline-alert").hide();  // Sembunyikan alert jika sebelumnya muncul
-
-    $("#totalin").text(response.totalin);
-    $("#totalout").text(response.totalout);
-    $("#totalcur").text(response.totalcur);
-
-    let html = '';
-    response.data.forEach(dept => {
-      html += `
-        <tr>
-          <td class="text-left bolded"><strong>${dept.dept}</strong></td>
-          <td class="bolded"><strong>${dept.in}</strong></td>
-          <td class="bolded"><strong>${dept.out}</strong></td>
-          <td class="bolded"><strong>${dept.cur}</strong></td>
-        </tr>
-      `;
-    });
-    $("#dept-table").html(html);
-  }).fail(function () {
-    // Jika AJAX gagal (misalnya koneksi putus), juga tampilkan alert
-    $("#offline-alert").show();
-    $("#totalin").text("-");
-    $("#totalout").text("-");
-    $("#totalcur").text("-");
-    $("#dept-table").html(`<tr><td colspan="4" class="text-center text-danger">Tidak dapat terhubung ke server</td></tr>`);
+  state.data.data = Array.from(depts.values());
+  state.data.totalin = delta.totalin;
+  state.data.totalout = delta.totalout;
+  state.data.totalcur = delta.totalcur;
+  state.version = delta.version;
+  renderData(state.data);
+}
+
+function renderData(response) {
+  if (response.offline) {
+    showOffline("Data tidak tersedia");
+    return;
+  }
+
+  $("#offline-alert").hide();  // Sembunyikan alert jika sebelumnya muncul
+
+  $("#totalin").text(response.totalin);
+  $("#totalout").text(response.totalout);
+  $("#totalcur").text(response.totalcur);
+
+  let html = '';
+  response.data.forEach(dept => {
+    html += `
+      <tr>
+        <td class="text-left bolded"><strong>${dept.dept}</strong></td>
+        <td class="bolded"><strong>${dept.in}</strong></td>
+        <td class="bolded"><strong>${dept.out}</strong></td>
+        <td class="bolded"><strong>${dept.cur}</strong></td>
+      </tr>
+    `;
   });
+  $("#dept-table").html(html);
 }
 
 
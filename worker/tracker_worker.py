@@ -1,13 +1,23 @@
 import os
 import sys
-import json
 import asyncio
 import signal
 import logging
 import platform
+import datetime
+import time
 from dotenv import load_dotenv
-from models.models import ZoneData, get_session
+from models.models import TrackerState, get_session, create_tables, utc_now
 from lib.api_tracker import AsyncApiTracker
+from lib.event_feed import EventFeed
+from lib.event_batch import dispatch_batch
+from lib.db_pool import get_pool, close_pool
+from lib.snapshot_cache import snapshot_cache
+from lib import jsonfast, metrics, snapshot_store
+from lib.history import store_events
+from lib.rollups import store_rollups, counts_before
+from lib.leader import LeaderLock
+from lib.scheduler import AdaptiveSchedule
 
 # Load path dan .env
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -21,70 +31,290 @@ logging.basicConfig(
 )
 log = logging.getLogger("tracker_worker")
 
+# Port /metrics khusus worker saat jalan sebagai proses sendiri (kosong = tidak dibuka)
+WORKER_METRICS_PORT = os.getenv("WORKER_METRICS_PORT", "")
+WORKER_PID_FILE = "worker.pid"
+
 # Konfigurasi zona
 ZONES = [
     {"name": "hijau", "in_env": "IN_DEVICES_HIJAU", "out_env": "OUT_DEVICES_HIJAU", "interval_env": "INTERVAL_HIJAU_SEC"},
     {"name": "merah", "in_env": "IN_DEVICES_MERAH", "out_env": "OUT_DEVICES_MERAH", "interval_env": "INTERVAL_MERAH_SEC"},
 ]
 
+# === Metrics (/metrics) ===
+# Tahap fetch/parse/process dan history dikerjakan sekali untuk semua zona (zone="all")
+CYCLE_SECONDS = metrics.histogram("counting_worker_cycle_seconds", "Durasi satu siklus worker")
+STAGE_SECONDS = metrics.histogram(
+    "counting_worker_stage_seconds", "Durasi per tahap siklus (fetch, parse, process, enrich, persist)", ("zone", "stage")
+)
+CYCLE_PAGES = metrics.histogram("counting_worker_cycle_pages", "Halaman API per siklus", buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+CYCLE_EVENTS = metrics.histogram(
+    "counting_worker_cycle_events", "Event baru per siklus", buckets=(0, 10, 100, 1000, 10000, 100000)
+)
+TRANSITIONS = metrics.counter("counting_worker_transitions_total", "Perpindahan masuk/keluar yang sah", ("zone",))
+CYCLE_FAILURES = metrics.counter("counting_worker_cycle_failures_total", "Siklus gagal", ("reason",))
+SCHEDULE_LAG = metrics.histogram(
+    "counting_worker_schedule_lag_seconds", "Keterlambatan mulai siklus dari jadwal", ("zone",), buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120)
+)
+SCHEDULE_INTERVAL = metrics.gauge("counting_worker_schedule_interval_seconds", "Interval jadwal zona saat ini", ("zone",))
+SCHEDULE_RATE = metrics.gauge("counting_worker_event_rate", "Rata-rata perpindahan per detik (EWMA)", ("zone",))
+SKIPPED_TICKS = metrics.counter("counting_worker_skipped_ticks_total", "Tick jadwal yang dilewati karena siklus sebelumnya lama", ("zone",))
+SNAPSHOT_BYTES = metrics.gauge("counting_worker_snapshot_bytes", "Ukuran snapshot terakhir yang disimpan (terkompres)", ("zone",))
+PROFILE_WRITES = metrics.counter("counting_worker_profile_writes_total", "Profil orang yang ditulis ulang karena baru/berubah", ("zone",))
+
 
-async def fetch_and_store(zone: str, in_devices: list[str], out_devices: list[str]):
+async def fetch_and_store(zone: str, tracker: AsyncApiTracker):
     try:
-        log.info("[%s] 🔄 Fetching data ...", zone.upper())
-        tracker = AsyncApiTracker(in_devices=in_devices, out_devices=out_devices)
-        data = await asyncio.wait_for(tracker.run(), timeout=120)
+        with STAGE_SECONDS.time(zone=zone, stage="enrich"):
+            data = await tracker.run()
 
         # Cek validitas data
         if not isinstance(data, dict):
             log.warning("[%s] ⚠️ Data tidak valid, skip simpan", zone.upper())
             return
         if data.get("offline"):
-            log.warning("[%s] ⚠️ API offline, skip simpan", zone.upper())
+            log.warning("[%s] ⚠️ Database offline, skip simpan", zone.upper())
             return
 
-        with get_session() as session:
-            session.query(ZoneData).filter(ZoneData.zone == zone).delete()
-            session.add(ZoneData(zone=zone, data=json.dumps(data, default=str)))
-            session.commit()
+        with STAGE_SECONDS.time(zone=zone, stage="persist"):
+            # Satu upsert snapshot terkompres + profil yang baru/berubah saja
+            payload, profiles = snapshot_store.encode(data)
+            updated_at = utc_now()
+            pool = await get_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    written = await snapshot_store.save(conn, zone, payload, profiles, updated_at)
+            snapshot_store.profile_writer.commit(written)
+            SNAPSHOT_BYTES.set(len(payload), zone=zone)
+            PROFILE_WRITES.inc(len(written), zone=zone)
+            snapshot_cache.publish(zone, data, updated_at)
 
         log.info("[%s] ✅ Saved (in: %d, out: %d, cur: %d)", zone.upper(), data['totalin'], data['totalout'], data['totalcur'])
 
-    except asyncio.TimeoutError:
-        log.warning("[%s] ⏱️ Timeout saat fetch data", zone.upper())
     except Exception:
         log.exception("[%s] ❌ Gagal menyimpan data", zone.upper())
 
 
-async def zone_loop(zone_cfg: dict):
-    name = zone_cfg["name"]
-    in_devices = [d.strip() for d in os.getenv(zone_cfg["in_env"], "").split(",") if d.strip()]
-    out_devices = [d.strip() for d in os.getenv(zone_cfg["out_env"], "").split(",") if d.strip()]
-    interval = int(os.getenv(zone_cfg["interval_env"], "30"))
+async def store_history(trackers: dict) -> bool:
+    # Riwayat event dan rollup ditulis dalam satu transaksi
+    records = [(zone, *event) for zone, tracker in trackers.items() for event in tracker.pending_events]
+    if not records:
+        return True
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                inserted = await store_events(conn, records)
+                for zone, tracker in trackers.items():
+                    events = tracker.pending_events
+                    if events:
+                        await store_rollups(conn, zone, events, counts_before(tracker, events), inserted)
+    except Exception:
+        log.exception("[Worker] ❌ Gagal menyimpan riwayat event (%d event)", len(records))
+        return False
+
+    for tracker in trackers.values():
+        tracker.pending_events = []
+    log.info("[Worker] 🗂️ Riwayat event tersimpan: %d baru", len(inserted))
+    return True
+
 
-    if not in_devices or not out_devices:
-        log.warning("[%s] ❌ IN/OUT devices belum disetel di .env", name.upper())
+def save_state(feed: EventFeed, trackers: dict):
+    # Semua zona disimpan dalam satu transaksi bersama cursor feed, supaya selalu konsisten
+    if not any(t.dirty for t in trackers.values()):
         return
+    cursor = feed.snapshot()
+    with get_session() as session:
+        for zone, tracker in trackers.items():
+            state = tracker.snapshot_state()
+            state.update(cursor)
+            session.merge(TrackerState(zone=zone, day=state["day"], state=jsonfast.dumps(state).decode("utf-8")))
+        session.commit()
+    for tracker in trackers.values():
+        tracker.dirty = False
+
+
+def load_state(feed: EventFeed, trackers: dict):
+    # Lanjut dari state tersimpan hanya kalau semua zona punya state hari ini dengan cursor yang sama
+    try:
+        with get_session() as session:
+            records = {r.zone: r for r in session.query(TrackerState).filter(TrackerState.zone.in_(list(trackers)))}
+        states = {zone: jsonfast.loads(r.state) for zone, r in records.items()}
+        today = datetime.date.today().isoformat()
+        if set(states) != set(trackers) or any(state.get("day") != today for state in states.values()):
+            return
+        if len({state.get("cursor_time") for state in states.values()}) != 1:
+            return
+
+        for zone, state in states.items():
+            trackers[zone].restore_state(state)
+        feed.restore(next(iter(states.values())), datetime.date.today())
+        log.info("[Worker] ♻️ State dilanjutkan dari %s", feed.cursor_time)
+    except Exception:
+        log.exception("[Worker] ⚠️ Gagal load state, mulai dari 00:00")
+
+
+def build_trackers() -> dict:
+    trackers = {}
+    for zone_cfg in ZONES:
+        name = zone_cfg["name"]
+        in_devices = [d.strip() for d in os.getenv(zone_cfg["in_env"], "").split(",") if d.strip()]
+        out_devices = [d.strip() for d in os.getenv(zone_cfg["out_env"], "").split(",") if d.strip()]
 
-    log.info("[%s] 🟢 Worker berjalan setiap %ds", name.upper(), interval)
+        if not in_devices or not out_devices:
+            log.warning("[%s] ❌ IN/OUT devices belum disetel di .env", name.upper())
+            continue
+        trackers[name] = AsyncApiTracker(in_devices=in_devices, out_devices=out_devices)
+    return trackers
 
-    while True:
-        await fetch_and_store(name, in_devices, out_devices)
-        await asyncio.sleep(interval)
+
+async def ingest_cycle(feed: EventFeed, trackers: dict, zones=None):
+    # Event selalu diterapkan ke semua zona; enrich + snapshot hanya untuk `zones` (default semua).
+    # Hasilnya jumlah perpindahan baru per zona, None kalau API offline
+    log.info("[Worker] 🔄 Fetching data ...")
+    started = time.perf_counter()
+    new_events = await feed.run()
+    parse_sec = feed.stats.get("parse_sec", 0.0)
+    STAGE_SECONDS.observe(time.perf_counter() - started - parse_sec, zone="all", stage="fetch")
+    STAGE_SECONDS.observe(parse_sec, zone="all", stage="parse")
+    CYCLE_PAGES.observe(feed.stats.get("pages", 0))
+    if feed.stats.get("skipped"):
+        CYCLE_FAILURES.inc(reason="circuit_open")
+        log.warning("[Worker] ⛔ API circuit open, fetch dilewati (coba lagi %.0fs)", feed.circuit.retry_in())
+        return None
+    if feed.api_offline:
+        CYCLE_FAILURES.inc(reason="api_offline")
+        for zone in trackers:
+            log.warning("[%s] ⚠️ API offline, skip simpan", zone.upper())
+        return None
+    CYCLE_EVENTS.observe(len(new_events))
+
+    pending = {zone: len(tracker.pending_events) for zone, tracker in trackers.items()}
+    with STAGE_SECONDS.time(zone="all", stage="process"):
+        for tracker in trackers.values():
+            tracker.sync_day(feed.cursor_day)
+        dispatch_batch(new_events, trackers.values())
+    counts = {zone: len(tracker.pending_events) - pending[zone] for zone, tracker in trackers.items()}
+    for zone, count in counts.items():
+        TRANSITIONS.inc(count, zone=zone)
+
+    for zone, tracker in trackers.items():
+        if zones is None or zone in zones:
+            await fetch_and_store(zone, tracker)
+
+    with STAGE_SECONDS.time(zone="all", stage="persist"):
+        if not await store_history(trackers):
+            # State tidak disimpan dulu, supaya kalau worker restart event-nya diproses (dan disimpan) ulang
+            CYCLE_FAILURES.inc(reason="history")
+            return counts
+        save_state(feed, trackers)
+    return counts
+
+
+async def start_metrics_server(port: int):
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=metrics.REGISTRY.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+    log.info("[Worker] 📈 /metrics worker di port %d", port)
+    return runner
+
+
+def update_schedules(schedules: dict, due: list, counts, started: float, finished: float):
+    if counts:
+        for zone, count in counts.items():
+            schedules[zone].observe(count, finished)
+    for zone in due:
+        schedule = schedules[zone]
+        old_interval = schedule.interval
+        lag, skipped = schedule.advance(started, finished)
+        SCHEDULE_LAG.observe(lag, zone=zone)
+        SCHEDULE_INTERVAL.set(schedule.interval, zone=zone)
+        SCHEDULE_RATE.set(round(schedule.rate or 0.0, 4), zone=zone)
+        if skipped:
+            SKIPPED_TICKS.inc(skipped, zone=zone)
+            log.warning("[%s] ⏭️ Siklus %.1fs, %d tick dilewati (lag %.1fs)", zone.upper(), finished - started, skipped, lag)
+        if schedule.interval != old_interval:
+            log.info("[%s] ⏱️ Interval %ds -> %ds (%.2f event/detik)", zone.upper(), old_interval, schedule.interval, schedule.rate or 0.0)
 
 
 async def run_worker():
     log.info("[Worker] 🟢 Async tracker worker dimulai...")
-    await asyncio.gather(*(zone_loop(zone) for zone in ZONES))
+    zones = set(build_trackers())
+    if not zones:
+        return
+
+    # Satu feed untuk semua zona yang dipimpin: transaksi diambil sekali setiap ada zona yang jatuh tempo
+    schedules = {
+        zone_cfg["name"]: AdaptiveSchedule(int(os.getenv(zone_cfg["interval_env"], "30")))
+        for zone_cfg in ZONES if zone_cfg["name"] in zones
+    }
+    interval = min(int(os.getenv(zone_cfg["interval_env"], "30")) for zone_cfg in ZONES if zone_cfg["name"] in zones)
+    leader = LeaderLock()
+    feed, trackers = None, None
+    metrics_runner = await start_metrics_server(int(WORKER_METRICS_PORT)) if WORKER_METRICS_PORT else None
+
+    try:
+        while True:
+            # Hanya satu worker per zona (lintas proses/mesin), dicek ulang tiap siklus
+            held = await leader.acquire(zones)
+            if trackers is None or held != set(trackers):
+                if feed is not None:
+                    await feed.close()
+                trackers = {zone: t for zone, t in build_trackers().items() if zone in held}
+                feed = EventFeed()
+                if trackers:
+                    load_state(feed, trackers)
+                    log.info("[Worker] 🟢 Zona %s berjalan (interval %s)", ", ".join(z.upper() for z in trackers),
+                             ", ".join("%ds" % schedules[z].interval for z in trackers))
+                else:
+                    log.info("[Worker] ⏸️ Semua zona dipegang worker lain, menunggu lock...")
+
+            if not trackers:
+                await asyncio.sleep(interval)
+                continue
+
+            started = time.time()
+            due = [zone for zone in trackers if schedules[zone].is_due(started)]
+            if due:
+                counts = None
+                try:
+                    with CYCLE_SECONDS.time():
+                        counts = await asyncio.wait_for(ingest_cycle(feed, trackers, due), timeout=120)
+                except asyncio.TimeoutError:
+                    CYCLE_FAILURES.inc(reason="timeout")
+                    log.warning("[Worker] ⏱️ Timeout saat fetch data")
+                except Exception:
+                    CYCLE_FAILURES.inc(reason="error")
+                    log.exception("[Worker] ❌ Siklus gagal")
+                update_schedules(schedules, due, counts, started, time.time())
+
+            # Tidur sampai zona berikutnya jatuh tempo (selalu tick setelah siklus selesai, jadi tidak tumpang tindih)
+            wake = min(schedules[zone].due_at for zone in trackers)
+            await asyncio.sleep(max(0.0, wake - time.time()))
+    finally:
+        if feed is not None:
+            await feed.close()
+        await leader.release()
+        await close_pool()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 def setup_graceful_shutdown(loop: asyncio.AbstractEventLoop):
     async def shutdown():
         log.info("[Worker] 🛑 Sedang shutdown...")
-        tasks = [t for t in asyncio.all_tasks(loop) if not t.done()]
+        # Task shutdown sendiri jangan ikut di-cancel; run_worker selesai lewat finally (lock & pool dilepas)
+        tasks = [t for t in asyncio.all_tasks(loop) if t is not asyncio.current_task() and not t.done()]
         for t in tasks:
             t.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
-        loop.stop()
         log.info("[Worker] ✅ Shutdown selesai")
 
     for sig in (signal.SIGINT, signal.SIGTERM):
@@ -98,6 +328,10 @@ if __name__ == "__main__":
     if platform.system() == "Windows":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+    # Mode worker terpisah: python -m worker.tracker_worker (web dijalankan dengan WORKER_MODE=external)
+    create_tables()
+    with open(WORKER_PID_FILE, "w") as f:
+        f.write(str(os.getpid()))  # dibaca stop_worker.bat
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     setup_graceful_shutdown(loop)
@@ -107,5 +341,16 @@ if __name__ == "__main__":
     except (KeyboardInterrupt, asyncio.CancelledError):
         log.info("[Worker] 🚪 Keluar dari loop")
     finally:
+        # Di Windows Ctrl+C datang sebagai KeyboardInterrupt saat run_worker masih jalan: cancel dulu
+        # supaya finally-nya (lock & pool dilepas) jalan, bukan ditunggu selamanya
+        pending = [t for t in asyncio.all_tasks(loop) if not t.done()]
+        for t in pending:
+            t.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
         loop.close()
+        try:
+            os.remove(WORKER_PID_FILE)
+        except OSError:
+            pass
         log.info("[Worker] ✅ Loop closed cleanly")
\ No newline at end of file